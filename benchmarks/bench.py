@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+VivreÀ – Benchmarks des parseurs et de l'étape 8 sur données synthétiques.
+
+    python benchmarks/bench.py                         # tous les cas, échelles 1, 5, 20
+    python benchmarks/bench.py --scales 1 --only crime-2025,build
+    python benchmarks/bench.py --save-baseline         # remplace benchmarks/baseline.json
+    python benchmarks/bench.py --only build --rev ba0f14f^   # update.py d'une autre révision
+
+Échelle 1 ≈ volumétrie de production : 35 000 communes (DBF ARCEP, Filosofi,
+génération), ≈ 2 M lignes SSMSI, 10 000 stations carburants ; ATMO : une année
+d'indices journaliers par commune (≈ 12,8 M lignes, 128 pages WFS). Les
+entrées sont générées par le processus parent dans un répertoire temporaire ;
+chaque (cas, échelle) est mesuré dans un processus enfant (pic RSS propre).
+Les fetchers réseau lisent leurs entrées via une cassette rejouée en local
+(update.start_replay) : aucune requête ne sort de la machine. Avec --rev,
+l'enfant mesure l'update.py de cette révision git (mêmes entrées, même
+harnais) et le rapport le compare à baseline.json, produit sur l'arbre courant.
+"""
+
+import os
+import io
+import csv
+import sys
+import json
+import gzip
+import time
+import random
+import struct
+import zipfile
+import argparse
+import tempfile
+import importlib.util
+import subprocess
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import update   # noqa: E402
+
+BASELINE_FILE = Path(__file__).resolve().parent / "baseline.json"
+SCALES        = (1, 5, 20)
+BASE_COMMUNES = 35_000
+BASE_STATIONS = 10_000
+AIR_DAYS      = 365      # indices journaliers ATMO par commune (une année complète)
+SEED          = 2024
+
+# Hôtes fictifs des fichiers servis par la cassette (les URL d'API sont celles d'update.py)
+STATIC = "https://static.data.gouv.fr/bench"
+
+
+# ---------------------------------------------------------------------------
+# Générateurs
+# ---------------------------------------------------------------------------
+
+def synthetic_codes(scale: int) -> list[str]:
+    """
+    Codes INSEE synthétiques, ≈ 35 000 × scale, répartis sur 101 départements
+    (2A/2B, outre-mer compris). Au-delà de 999 communes par département le
+    numéro passe sur 4 chiffres (codes à 6 caractères, hors domaine réel).
+    """
+    deps = [f"{d:02d}" for d in range(1, 96) if d != 20] + ["2A", "2B", "971", "972", "973", "974", "976"]
+    per_dep = BASE_COMMUNES * scale // len(deps)
+    width   = 3 if per_dep < 1000 else 4
+    codes   = []
+    for dep in deps:
+        digits = width - (len(dep) - 2)
+        codes.extend(f"{dep}{n:0{digits}d}" for n in range(1, per_dep + 1))
+    return codes
+
+
+def synthetic_sources(scale: int) -> tuple:
+    """Entrées de build_index_and_details : (communes, dvf, fibre, crime, air, socio)."""
+    rnd = random.Random(SEED)
+    communes, dvf, fibre, crime, air, socio = [], {}, {}, {}, {}, {}
+    for code in synthetic_codes(scale):
+        dep = update.dep_of(code)
+        cp  = update._dep_prefix(code).ljust(5, "0")
+        communes.append({
+            "code": code, "nom": f"Saint-{rnd.choice(('Martin', 'Étienne', 'Œuf', 'Jean'))}-{code}",
+            "codeDepartement": dep, "codeRegion": "11", "codesPostaux": [cp],
+            "population": rnd.randint(10, 50_000), "surface": rnd.randint(100, 10_000),
+            "centre": {"type": "Point", "coordinates": [2 + rnd.random(), 46 + rnd.random()]},
+        })
+        dvf[code] = {"prix_m2_median": rnd.randint(800, 6000), "loyer_median": None,
+                     "nb_transactions": rnd.randint(1, 900), "annee_dvf": 2023}
+        fibre[code] = round(rnd.uniform(0, 100), 1)
+        if rnd.random() < 0.3:
+            crime[code] = {"taux_pour_mille": round(rnd.uniform(0, 60), 1), "annee": 2023}
+        air[code]   = {"iqa_moyen": round(rnd.uniform(1, 5), 1), "label": "Moyen", "annee": 2023}
+        socio[code] = {"revenu_median": rnd.randint(14_000, 35_000),
+                       "taux_pauvrete": round(rnd.uniform(3, 40), 1), "annee": 2021}
+    return communes, dvf, fibre, crime, air, socio
+
+
+def write_dbf(path: Path, scale: int) -> int:
+    """ZIP contenant un DBF façon ARCEP (INSEE_COM, Locaux, ftth + colonnes inutilisées)."""
+    rnd    = random.Random(SEED)
+    fields = [("INSEE_COM", "C", 5), ("NOM_COM", "C", 60), ("Locaux", "N", 10), ("ftth", "N", 10),
+              *((f"COL{i:02d}", "N", 12) for i in range(16))]
+    record_size = 1 + sum(length for _, _, length in fields)
+    codes  = synthetic_codes(scale)
+    header = struct.pack("<BBBBIHH20x", 3, 124, 1, 1, len(codes), 32 + 32 * len(fields) + 1, record_size)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as z, \
+            z.open("communes.dbf", "w", force_zip64=True) as f:
+        f.write(header)
+        for name, kind, length in fields:
+            f.write(struct.pack("<11sc4xB15x", name.encode(), kind.encode(), length))
+        f.write(b"\x0d")
+        rows = []
+        for code in codes:
+            locaux = rnd.randint(50, 20_000)
+            rec = [b" ", code[-5:].encode().ljust(5), f"Commune {code}".encode().ljust(60),
+                   str(locaux).encode().rjust(10), str(rnd.randint(0, locaux)).encode().rjust(10)]
+            rec.extend(f"{rnd.random() * 1e6:.2f}".encode().rjust(12) for _ in range(16))
+            rows.append(b"".join(rec))
+            if len(rows) == 4096:
+                f.write(b"".join(rows))
+                rows.clear()
+        f.write(b"".join(rows) + b"\x1a")
+    return len(codes)
+
+
+# Ancien format SSMSI (virgules, guillemets) et format 2025 (points-virgules, virgule décimale)
+_CRIME_OLD_HEADER = ["Code.commune", "annee", "classe", "unité.de.compte", "valeur.publiée", "faits",
+                     "tauxpourmille", "complementinfoval", "complementinfotaux", "POP", "millPOP",
+                     "LOGTS", "millLOGTS"]
+_CRIME_2025_HEADER = ["CODGEO_2025", "annee", "indicateur", "unite_de_compte", "nombre", "taux_pour_mille",
+                      "est_diffuse", "insee_pop", "insee_pop_millesime", "insee_log", "insee_log_millesime"]
+_CRIME_CLASSES = ["Cambriolages de logement", "Coups et blessures volontaires", "Destructions et dégradations",
+                  "Escroqueries", "Trafic de stupéfiants", "Usage de stupéfiants", "Violences sexuelles",
+                  "Vols avec armes", "Vols de véhicules", "Vols dans les véhicules", "Vols sans violence",
+                  "Vols violents sans arme"]
+
+
+def write_crime_csv(path: Path, scale: int, layout: str) -> int:
+    """CSV.GZ communal SSMSI : 12 indicateurs × 5 années par commune (≈ 2 M lignes à l'échelle 1)."""
+    rnd  = random.Random(SEED)
+    rows = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=1) as f:
+        if layout == "old":
+            w = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+            w.writerow(_CRIME_OLD_HEADER)
+        else:
+            w = csv.writer(f, delimiter=";")
+            w.writerow(_CRIME_2025_HEADER)
+        for code in synthetic_codes(scale):
+            pop = rnd.randint(100, 80_000)
+            for annee in range(2019, 2024):
+                for classe in _CRIME_CLASSES:
+                    faits = rnd.randint(0, 400)
+                    if layout == "old":
+                        w.writerow([code, annee - 2000, classe, "infractions", "diff", faits,
+                                    faits / pop * 1000, "", "", pop, 2020, pop // 2, 2020])
+                    else:
+                        diffuse = "ndiff" if faits < 5 else "diff"
+                        w.writerow([code, annee, classe, "infraction", "NA" if diffuse == "ndiff" else faits,
+                                    f"{faits / pop * 1000:.3f}".replace(".", ","), diffuse, pop, 2021,
+                                    pop // 2, 2021])
+                    rows += 1
+    return rows
+
+
+def write_fuel_xml(path: Path, scale: int) -> int:
+    """Flux roulez-eco : ≈ 10 000 × scale <pdv> (5 prix, horaires, services, ruptures)."""
+    rnd   = random.Random(SEED)
+    fuels = [("Gazole", 1), ("SP95", 2), ("E85", 3), ("GPLc", 4), ("E10", 5), ("SP98", 6)]
+    n     = BASE_STATIONS * scale
+    with open(path, "w", encoding="ISO-8859-1") as f:
+        f.write('<?xml version="1.0" encoding="ISO-8859-1" standalone="yes"?>\n<pdv_liste>\n')
+        for i in range(n):
+            cp = f"{rnd.randint(1, 95):02d}{rnd.randint(0, 999):03d}"
+            f.write(f'<pdv id="{i + 1000000}" latitude="{rnd.uniform(4200000, 5100000):.0f}" '
+                    f'longitude="{rnd.uniform(-400000, 800000):.0f}" cp="{cp}" pop="R">'
+                    f'<adresse>{rnd.randint(1, 200)} avenue de la République</adresse><ville>Ville {cp}</ville>'
+                    '<horaires automate-24-24="1">'
+                    + "".join(f'<jour id="{d}" nom="J{d}" ferme=""><horaire ouverture="07.00" fermeture="20.00"/></jour>'
+                              for d in range(1, 8))
+                    + '</horaires><services><service>Boutique alimentaire</service><service>Station de gonflage</service>'
+                    '<service>Lavage automatique</service></services>')
+            for nom, fid in rnd.sample(fuels, 5):
+                f.write(f'<prix nom="{nom}" id="{fid}" maj="2025-06-{rnd.randint(1, 28):02d}T0{rnd.randint(0, 9)}:15:00" '
+                        f'valeur="{rnd.uniform(1.6, 2.1):.3f}"/>')
+            f.write('<rupture id="3" nom="E85" debut="2025-05-01T10:00:00" fin="" type="temporaire"/></pdv>\n')
+        f.write("</pdv_liste>\n")
+    return n
+
+
+_FILOSOFI_MEASURES = ["NB_MEN", "NB_PERS", "MED_SL", "PR_MD60", "PR_MD60_MEN", "D1_SL", "D9_SL", "RD_SL",
+                      "S80S20_SL", "GI_SL", "PACT", "PTSA", "PCHO", "PBEN", "PPEN", "PPAT"]
+
+
+def write_filosofi_zip(path: Path, scale: int, layout: str) -> int:
+    """ZIP Filosofi : format SDMX long (16 mesures par commune) ou ancien format large."""
+    rnd = random.Random(SEED)
+    buf = io.StringIO()
+    w   = csv.writer(buf, delimiter=";", lineterminator="\n")
+    rows = 0
+    if layout == "long":
+        w.writerow(["GEO", "GEO_OBJECT", "FILOSOFI_MEASURE", "UNIT_MULT", "CONF_STATUS",
+                    "OBS_STATUS", "TIME_PERIOD", "OBS_VALUE"])
+        for code in synthetic_codes(scale):
+            for measure in _FILOSOFI_MEASURES:
+                value = rnd.uniform(14_000, 35_000) if measure == "MED_SL" else rnd.uniform(0, 40)
+                w.writerow([code, "COM", measure, 0, "F", "A", 2021, f"{value:.1f}"])
+                rows += 1
+    else:
+        w.writerow(["CODGEO", "NBMENFISC21", "NBPERSMENFISC21", "MED21", "PIMP21", "TP6021",
+                    *(f"TP60AGE{i}21" for i in range(1, 7)), "D121", "D921", "RD21"])
+        for code in synthetic_codes(scale):
+            w.writerow([code, rnd.randint(50, 9000), rnd.randint(100, 20_000), f"{rnd.uniform(14_000, 35_000):.0f}",
+                        rnd.randint(20, 80), f"{rnd.uniform(3, 40):.1f}".replace(".", ","),
+                        *(f"{rnd.uniform(3, 40):.1f}" for _ in range(6)), 12000, 40000, 3.2])
+            rows += 1
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("DS_FILOSOFI_CC_data.csv", buf.getvalue())
+        z.writestr("DS_FILOSOFI_CC_metadata.csv", "COD_VAR;LIB_VAR\n")
+    return rows
+
+
+def write_atmo_pages(workdir: Path, scale: int) -> tuple[int, list[Path]]:
+    """
+    Pages CSV du WFS ATMO (propertyName=code_zone,code_qual,type_zone) :
+    AIR_DAYS indices journaliers par commune, découpés en pages de
+    update.ATMO_PAGE_SIZE lignes.
+    """
+    rnd   = random.Random(SEED)
+    codes = synthetic_codes(scale)
+    rows  = len(codes) * AIR_DAYS
+    pages = [workdir / f"atmo-{i}.csv" for i in range(-(-rows // update.ATMO_PAGE_SIZE))]
+    n = 0
+    for path in pages:
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["FID", "code_zone", "code_qual", "type_zone"])
+            for k in range(n, min(n + update.ATMO_PAGE_SIZE, rows)):
+                w.writerow([f"ind_atmo.{k}", codes[k % len(codes)], rnd.randint(1, 5), "commune"])
+            n = k + 1
+    return rows, pages
+
+
+def _atmo_years() -> list[int]:
+    year = time.localtime().tm_year
+    return list(range(year - 1, year - 4, -1))   # années sondées par fetch_air_quality
+
+
+# ---------------------------------------------------------------------------
+# Cassettes (fichiers servis aux fetchers par update.start_replay)
+# ---------------------------------------------------------------------------
+
+def _prepared_url(url: str, params: dict = None) -> str:
+    import requests
+    return requests.Request("GET", url, params=params).prepare().url
+
+
+def write_cassette(directory: Path, responses: dict[str, Path], content_types: dict[str, str] = None) -> None:
+    """Cassette update.py : {url: fichier du corps}, réponses 200 avec ETag."""
+    import hashlib
+    bodies = directory / "bodies"
+    bodies.mkdir(parents=True, exist_ok=True)
+    entries = {}
+    for url, body in responses.items():
+        digest = hashlib.sha1(body.read_bytes()).hexdigest()
+        os.replace(body, bodies / digest)
+        entries[update.cassette_key("GET", url)] = [{
+            "status":   200,
+            "headers":  {"Content-Type": (content_types or {}).get(url, "application/octet-stream"),
+                         "ETag": f'"{digest[:16]}"'},
+            "encoding": None,
+            "body":     digest,
+        }]
+    (directory / "cassette.json").write_text(json.dumps({
+        "version": update.CASSETTE_VERSION, "recorded_at": "synthétique", "entries": entries,
+    }), encoding="utf-8")
+
+
+def _dataset_cassette(workdir: Path, slug: str, resource: dict, body: Path) -> None:
+    meta = workdir / "dataset.json"
+    meta.write_text(json.dumps({"resources": [resource]}), encoding="utf-8")
+    write_cassette(workdir / "cassette", {
+        f"https://www.data.gouv.fr/api/1/datasets/{slug}/": meta,
+        resource["url"]: body,
+    }, {f"https://www.data.gouv.fr/api/1/datasets/{slug}/": "application/json"})
+
+
+# ---------------------------------------------------------------------------
+# Cas mesurés
+# ---------------------------------------------------------------------------
+# prepare(workdir, scale) → lignes d'entrée (processus parent) ;
+# run(workdir, scale) → enregistrements produits (processus enfant, chronométré).
+
+class Case(NamedTuple):
+    prepare: Callable
+    run:     Callable
+    setup:   Callable = None   # processus enfant, non chronométré → objet passé à run
+
+
+def _prepare_dbf(workdir: Path, scale: int) -> int:
+    return write_dbf(workdir / "arcep.zip", scale)
+
+
+def _run_dbf(workdir: Path, scale: int, _=None) -> int:
+    n = 0
+    with zipfile.ZipFile(workdir / "arcep.zip") as z, z.open("communes.dbf") as f:
+        for _ in update._iter_dbf(f, ["INSEE_COM", "Locaux", "ftth"]):
+            n += 1
+    return n
+
+
+def _prepare_crime(layout: str) -> Callable:
+    def prepare(workdir: Path, scale: int) -> int:
+        body = workdir / "crime.csv.gz"
+        rows = write_crime_csv(body, scale, layout)
+        _dataset_cassette(workdir, update.CRIME_DATASET, {
+            "title": "Base communale de la délinquance enregistrée", "format": "csv.gz",
+            "url": f"{STATIC}/crime-{layout}.csv.gz",
+        }, body)
+        return rows
+    return prepare
+
+
+def _prepare_fuel(workdir: Path, scale: int) -> int:
+    return write_fuel_xml(workdir / "PrixCarburants_instantane.xml", scale)
+
+
+def _run_fuel(workdir: Path, scale: int, _=None) -> int:
+    with open(workdir / "PrixCarburants_instantane.xml", "rb") as f:
+        return sum(1 for _ in update._iter_fuel_stations(f))
+
+
+def _prepare_filosofi(layout: str) -> Callable:
+    def prepare(workdir: Path, scale: int) -> int:
+        body = workdir / "filosofi.zip"
+        rows = write_filosofi_zip(body, scale, layout)
+        write_cassette(workdir / "cassette", {update.FILOSOFI_URL: body})
+        return rows
+    return prepare
+
+
+def _prepare_air(workdir: Path, scale: int) -> int:
+    rows, pages = write_atmo_pages(workdir, scale)
+    year     = _atmo_years()[0]
+    bodies   = {}
+    for y in _atmo_years():
+        hits = workdir / f"hits-{y}.xml"
+        hits.write_text(f'<?xml version="1.0" encoding="UTF-8"?><wfs:FeatureCollection numberMatched="{rows}" '
+                        f'numberReturned="0" xmlns:wfs="http://www.opengis.net/wfs/2.0"/>', encoding="utf-8")
+        bodies[_prepared_url(update.ATMO_WFS_BASE, update.atmo_wfs_params(y, hits=True))] = hits
+    for i, page in enumerate(pages):
+        params = update.atmo_wfs_params(year, i * update.ATMO_PAGE_SIZE, update.ATMO_PAGE_SIZE)
+        bodies[_prepared_url(update.ATMO_WFS_BASE, params)] = page
+    write_cassette(workdir / "cassette", bodies)
+    return rows
+
+
+def _replay(fetch: Callable) -> Callable:
+    def run(workdir: Path, scale: int, _=None) -> int:
+        return len(fetch())
+    return run
+
+
+def _setup_replay(workdir: Path, scale: int) -> None:
+    update.configure_http_cache(False)
+    update.CHECKPOINTS["enabled"] = False
+    update.configure_host_limits(rate=0)
+    update.start_replay(workdir / "cassette")
+
+
+def _setup_vivrescore(workdir: Path, scale: int) -> list:
+    _, _, fibre, crime, air, socio = synthetic_sources(scale)
+    return [(fibre.get(c), crime.get(c), air.get(c), socio.get(c)) for c in fibre]
+
+
+def _run_vivrescore(workdir: Path, scale: int, rows: list) -> int:
+    for f, c, a, s in rows:
+        update.compute_vivrescore(f, c, a, s, s.get("taux_pauvrete") if s else None)
+    return len(rows)
+
+
+def _run_vivrescore_batch(workdir: Path, scale: int, rows: list) -> int:
+    columns = update.vivrescore_columns([update.vivrescore_inputs(*row) for row in rows])
+    update.percentile_ranks(update.compute_vivrescores(columns))
+    return len(rows)
+
+
+def _run_build(workdir: Path, scale: int, sources: tuple) -> int:
+    update.DETAILS_DIR.mkdir(parents=True, exist_ok=True)
+    n = update.build_index_and_details(*sources)
+    return len(sources[0]) if n is None else n   # None avant ba0f14f
+
+
+def _no_input(workdir: Path, scale: int) -> int:
+    return len(synthetic_codes(scale))   # entrées générées par l'enfant (setup)
+
+
+CASES: dict[str, Case] = {
+    "dbf":              Case(_prepare_dbf, _run_dbf),
+    "crime-old":        Case(_prepare_crime("old"), _replay(update.fetch_crime_data), _setup_replay),
+    "crime-2025":       Case(_prepare_crime("2025"), _replay(update.fetch_crime_data), _setup_replay),
+    "fuel":             Case(_prepare_fuel, _run_fuel),
+    "filosofi-long":    Case(_prepare_filosofi("long"), _replay(update.fetch_filosofi), _setup_replay),
+    "filosofi-wide":    Case(_prepare_filosofi("wide"), _replay(update.fetch_filosofi), _setup_replay),
+    "air":              Case(_prepare_air, _replay(update.fetch_air_quality), _setup_replay),
+    "vivrescore":       Case(_no_input, _run_vivrescore, _setup_vivrescore),
+    "vivrescore-batch": Case(_no_input, _run_vivrescore_batch, _setup_vivrescore),
+    "build":            Case(_no_input, _run_build, lambda workdir, scale: synthetic_sources(scale)),
+}
+
+
+# ---------------------------------------------------------------------------
+# Exécution
+# ---------------------------------------------------------------------------
+
+def load_revision(path: Path):
+    """Charge un update.py extrait d'une autre révision (--rev) à la place du module courant."""
+    spec   = importlib.util.spec_from_file_location("update", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def extract_revision(rev: str, root: Path) -> Path:
+    """update.py de la révision git `rev`, écrit dans `root`."""
+    proc = subprocess.run(["git", "-C", str(ROOT), "show", f"{rev}:update.py"], capture_output=True)
+    if proc.returncode != 0:
+        raise SystemExit(f"--rev {rev} : {proc.stderr.decode(errors='replace').strip()}")
+    path = root / "update-rev.py"
+    path.write_bytes(proc.stdout)
+    return path
+
+
+def run_child(name: str, scale: int, workdir: Path, module: Path = None) -> None:
+    """Processus enfant : prépare (non chronométré), mesure, écrit une ligne JSON."""
+    global update
+    peak_rss_mb = update.peak_rss_mb   # absent des révisions antérieures au harnais
+    if module:
+        update = load_revision(module)
+    os.chdir(workdir)
+    update.log.setLevel("WARNING")
+    case  = CASES[name]
+    state = case.setup(workdir, scale) if case.setup else None
+    start = time.perf_counter()
+    records = case.run(workdir, scale, state)
+    seconds = time.perf_counter() - start
+    print(json.dumps({"seconds": seconds, "records": records, "peak_rss_mb": peak_rss_mb()}))
+
+
+def measure(name: str, scale: int, root: Path, module: Path = None) -> dict:
+    workdir = root / f"{name}-{scale}"
+    workdir.mkdir()
+    rows = CASES[name].prepare(workdir, scale)
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", name, str(scale), str(workdir),
+         *(("--module", str(module)) if module else ())],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{name} ×{scale} : {proc.stderr.strip().splitlines()[-1:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result.update(rows=rows, rows_per_s=rows / result["seconds"] if result["seconds"] else None)
+    return result
+
+
+def report(results: dict, baseline: dict) -> None:
+    print(f"{'cas':<17}{'éch.':>5}{'lignes':>11}{'durée s':>10}{'lignes/s':>12}{'pic RSS Mo':>12}"
+          f"{'réf. s':>9}{'écart':>9}{'réf. Mo':>9}")
+    for key, r in results.items():
+        name, scale = key.rsplit("@", 1)
+        ref   = baseline.get(key)
+        delta = f"{(r['seconds'] / ref['seconds'] - 1) * 100:+.0f} %" if ref else "–"
+        print(f"{name:<17}{scale:>5}{r['rows']:>11}{r['seconds']:>10.2f}{r['rows_per_s'] or 0:>12,.0f}"
+              f"{r['peak_rss_mb'] or 0:>12.0f}{ref['seconds'] if ref else '–':>9}{delta:>9}"
+              f"{(ref or {}).get('peak_rss_mb') or '–':>9}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="VivreÀ – benchmarks sur données synthétiques.")
+    parser.add_argument("--only", default=None, metavar="CAS",
+                        help=f"cas à mesurer, séparés par des virgules ({', '.join(CASES)})")
+    parser.add_argument("--scales", default=",".join(map(str, SCALES)), metavar="N,N",
+                        help="échelles (multiplicateur de la volumétrie de production)")
+    parser.add_argument("--save-baseline", action="store_true", help=f"enregistre les résultats dans {BASELINE_FILE.name}")
+    parser.add_argument("--rev", default=None, metavar="RÉVISION",
+                        help="mesure update.py de cette révision git (comparaison avant/après)")
+    parser.add_argument("--child", nargs=3, metavar=("CAS", "ÉCHELLE", "DIR"), help=argparse.SUPPRESS)
+    parser.add_argument("--module", type=Path, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.child[0], int(args.child[1]), Path(args.child[2]), args.module)
+        return
+    if args.rev and args.save_baseline:
+        parser.error("--save-baseline enregistre la référence de l'arbre courant, pas celle de --rev")
+
+    names = args.only.split(",") if args.only else list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"cas inconnu(s) : {', '.join(unknown)}")
+    scales = [int(s) for s in args.scales.split(",")]
+    try:
+        baseline = json.loads(BASELINE_FILE.read_text(encoding="utf-8"))["results"]
+    except (OSError, ValueError, KeyError):
+        baseline = {}
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="vivrea-bench-") as tmp:
+        module = extract_revision(args.rev, Path(tmp)) if args.rev else None
+        for name in names:
+            for scale in scales:
+                results[f"{name}@{scale}"] = r = measure(name, scale, Path(tmp), module)
+                print(f"  {name} ×{scale} : {r['seconds']:.2f} s", file=sys.stderr)
+    report(results, baseline)
+
+    if args.save_baseline:
+        merged = {**baseline, **{k: {f: round(v, 3) if isinstance(v, float) else v for f, v in r.items()}
+                                 for k, r in results.items()}}
+        BASELINE_FILE.write_text(json.dumps({
+            "python":   sys.version.split()[0],
+            "platform": sys.platform,
+            "results":  dict(sorted(merged.items())),
+        }, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"Référence enregistrée : {BASELINE_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+'use strict';
+/**
+ * Repli des noms de communes pour la recherche : minuscules, suppression des
+ * diacritiques, séparateurs (tiret, espaces, apostrophes) → une espace.
+ *
+ * Implémentation unique côté navigateur : chargée par explorer.html et
+ * index.html, importée par search.worker.js (importScripts) et recopiée dans
+ * le worker inline WORKER_SRC (index.html). fold_name() dans update.py doit
+ * rester identique (tests/test_fold.py).
+ */
+function fold(str) {
+  return String(str)
+    .toLowerCase()
+    .normalize('NFD')
+    .replace(/[\u0300-\u036f]/g, '')
+    .replace(/[-\s'\u2019]+/g, ' ')
+    .trim();
+}
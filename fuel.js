@@ -2,27 +2,127 @@
 /**
  * FuelSearch – Recherche locale de prix carburants.
  *
- * Source unique : /data/carburants.json  (généré par GitHub Actions)
+ * Sources : /data/carburants.json  (généré par GitHub Actions)
+ *           /data/carburants/{préfixe CP}.json  (recherche par code postal :
+ *           stations du préfixe + indices pré-triés par prix, par carburant)
  * Aucun appel vers une API externe côté navigateur.
  *
  * API publique : FuelSearch.init(inputId, selectId, btnId, resultsId)
  */
 const FuelSearch = (() => {
-  const FUEL_URL = '/data/carburants.json';
+  const MANIFEST_URL = '/data/manifest.json';   // noms hachés (update.py --hashed)
 
-  let _promise = null;   // Promise unique (cache mémoire après 1er chargement)
-  let _flat    = null;   // tableau normalisé plat
+  let _promise  = null;  // Promise unique (cache mémoire après 1er chargement)
+  let _flat     = null;  // tableau normalisé plat
+  let _manifest = null;  // Promise de /data/manifest.json
+  let _shardIdx = null;  // Promise de /data/carburants/index.json
+  const _shards = {};    // préfixe → Promise du shard
+
+  function _manifestP() {
+    _manifest ??= fetch(MANIFEST_URL, { cache: 'no-store' })
+      .then(r => r.ok ? r.json() : null, () => null);
+    return _manifest;
+  }
+
+  function dataURL(name) {
+    return _manifestP().then(m => `/data/${m?.files?.[name] || name}`);
+  }
+
+  // ── Décodeur de référence de carburants.compact.json ─────────────────────
+  // Colonnes + dictionnaires (carburants, enseignes, villes), prix en
+  // millièmes, maj en secondes avant updated_at → forme de carburants.json.
+  function decodeCompact(d) {
+    if (d.v !== 1) throw new Error(`encodage carburants v${d.v} inconnu`);
+    const base = Math.floor(Date.parse(d.updated_at) / 1000);
+    const stations = new Array(d.prix_n.length);
+    let j = 0;
+    for (let i = 0; i < stations.length; i++) {
+      const prix = {}, maj = {};
+      for (const end = j + d.prix_n[i]; j < end; j++) {
+        const carb = d.carburants[d.prix_carb[j]];
+        prix[carb] = d.prix_val[j] / 1000;
+        if (d.prix_maj[j] != null) maj[carb] = new Date((base - d.prix_maj[j]) * 1000).toISOString().slice(0, 19);
+      }
+      stations[i] = {
+        nom:     d.enseignes[d.enseigne[i]],
+        cp:      d.cp[i],
+        ville:   d.villes[d.ville[i]],
+        adresse: d.adresse[i],
+        lat:     d.lat[i] != null ? d.lat[i] / 100000 : null,
+        lon:     d.lon[i] != null ? d.lon[i] / 100000 : null,
+        prix,
+        maj,
+      };
+    }
+    return { updated_at: d.updated_at, nb_stations: stations.length, stations };
+  }
 
   // ── Chargement avec cache mémoire ───────────────────────────────────────
   function load() {
     if (_promise) return _promise;
-    _promise = fetch(FUEL_URL, { cache: 'default' })
-      .then(r => { if (!r.ok) throw new Error(`HTTP ${r.status}`); return r.json(); })
+    // Encodage compact (update.py --fuel-compact) s'il est référencé par le manifeste
+    _promise = _manifestP()
+      .then(m => m?.files?.['carburants.compact.json']
+        ? getJSON('carburants.compact.json').then(decodeCompact)
+        : getJSON('carburants.json'))
       .then(data => { _flat = normalize(data); return _flat; })
       .catch(err => { _promise = null; throw err; });
     return _promise;
   }
 
+  // ── Shards par préfixe de code postal ───────────────────────────────────
+  function shardKey(cp) {
+    return /^9[78]/.test(cp) ? cp.slice(0, 3) : cp.slice(0, 2);
+  }
+
+  function getJSON(name) {
+    return dataURL(name)
+      .then(url => fetch(url, { cache: 'default' }))
+      .then(r => { if (!r.ok) throw new Error(`HTTP ${r.status}`); return r.json(); });
+  }
+
+  // Renvoie le shard couvrant `cp`, null si absent (index ou shard indisponible)
+  function loadShard(cp) {
+    _shardIdx ??= getJSON('carburants/index.json').catch(() => null);
+    return _shardIdx.then(idx => {
+      const key  = shardKey(cp);
+      const meta = idx?.shards?.[key];
+      if (!meta) return null;
+      _shards[key] ??= getJSON(meta.fichier).catch(() => { delete _shards[key]; return null; });
+      return _shards[key];
+    });
+  }
+
+  // Les listes `tri` sont déjà triées par prix : filtre + fusion, aucun tri
+  function searchShard(shard, cp, carburant) {
+    const match = i => shard.stations[i].cp.startsWith(cp);
+    const row = (i, type) => {
+      const s = shard.stations[i];
+      return {
+        nom: s.nom || '', cp: s.cp || '', ville: s.ville || '', adresse: s.adresse || '',
+        lat: s.lat ?? null, lon: s.lon ?? null,
+        carburant: type, prix: s.prix[type], maj: (s.maj || {})[type] || '',
+      };
+    };
+    const types = carburant && carburant !== 'Tous'
+      ? [carburant].filter(t => shard.tri[t])
+      : Object.keys(shard.tri);
+    const lists = types.map(t => ({ t, idx: shard.tri[t].filter(match), pos: 0 }));
+
+    const out = [];
+    while (out.length < 20) {
+      let best = null;
+      for (const l of lists) {
+        if (l.pos >= l.idx.length) continue;
+        const p = shard.stations[l.idx[l.pos]].prix[l.t];
+        if (!best || p < best.p) best = { l, p };
+      }
+      if (!best) break;
+      out.push(row(best.l.idx[best.l.pos++], best.l.t));
+    }
+    return out;
+  }
+
   // ── Normalisation : stations[]{prix:{SP95:1.73,…}} → tableau plat ───────
   function normalize(data) {
     const out = [];
@@ -145,8 +245,15 @@ const FuelSearch = (() => {
       results.innerHTML = `<div class="skeleton h-14 rounded-xl mt-3"></div>`;
 
       try {
-        await load();
-        const found = search(q, carb);
+        // Code postal (ou préfixe ≥ 2 chiffres) : shard seul, sinon fichier complet
+        const shard = /^\d{2,5}$/.test(q) ? await loadShard(q) : null;
+        let found;
+        if (shard) {
+          found = searchShard(shard, q, carb);
+        } else {
+          await load();
+          found = search(q, carb);
+        }
         render(results, found, q);
       } catch {
         results.innerHTML = `<p class="text-sm text-red-400 text-center py-4">Données indisponibles.</p>`;
@@ -160,5 +267,5 @@ const FuelSearch = (() => {
     if (select) select.addEventListener('change', () => { if (input.value.trim()) doSearch(); });
   }
 
-  return { init };
+  return { init, decodeCompact };
 })();
\ No newline at end of file
@@ -0,0 +1,34 @@
+'use strict';
+/**
+ * Décodeur de data/index.cols.json (update.py encode_index_columns), partagé
+ * par index.html et explorer.html.
+ *
+ * Entrée : { v: 1, n, nom[], insee[] (écarts successifs, 2A/2B → 20000/20500),
+ *            cp[] (décalage depuis le préfixe du département, ou chaîne),
+ *            pop (varints base64), vivrescore[] }
+ * Sortie : lignes de index.json — [nom, code_insee, cp, pop, vivrescore]
+ */
+function decodeIndexColumns(d) {
+  if (d.v !== 1) throw new Error(`index colonnaire v${d.v} inconnu`);
+  const bin = atob(d.pop), pops = new Array(d.n);
+  for (let i = 0, j = 0; i < d.n; i++) {
+    let v = 0, mul = 1, b;
+    do { b = bin.charCodeAt(j++); v += (b & 0x7f) * mul; mul *= 128; } while (b & 0x80);
+    pops[i] = v;
+  }
+  const rows = new Array(d.n);
+  let key = 0;
+  for (let i = 0; i < d.n; i++) {
+    key += d.insee[i];
+    const code = key >= 20000 && key < 21000
+      ? (key < 20500 ? '2A' + String(key - 20000).padStart(3, '0') : '2B' + String(key - 20500).padStart(3, '0'))
+      : String(key).padStart(5, '0');
+    let cp = d.cp[i];
+    if (typeof cp === 'number') {
+      const pre = /^2[AB]/.test(code) ? '20' : code.startsWith('97') ? code.slice(0, 3) : code.slice(0, 2);
+      cp = pre + String(cp).padStart(5 - pre.length, '0');
+    }
+    rows[i] = [d.nom[i], code, cp, pops[i], d.vivrescore[i]];
+  }
+  return rows;
+}
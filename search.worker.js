@@ -3,7 +3,8 @@
  * Reçoit les messages {type, payload} depuis le thread principal.
  *
  * Messages entrants :
- *   { type: 'INIT',   payload: [ [nom, code_insee, cp, pop], ... ] }
+ *   { type: 'INIT',   payload: { rows: [ [nom, code_insee, cp, pop], ... ], search } }
+ *                     (search = data/search.json, optionnel ; un tableau de lignes seul est accepté)
  *   { type: 'SEARCH', payload: { query: string, limit: number } }
  *
  * Messages sortants :
@@ -13,47 +14,91 @@
 
 'use strict';
 
-let index = [];   // Tableau brut reçu du thread principal
-let normalized = []; // Noms normalisés (sans accents, lowercase) pour comparaison rapide
+importScripts('/fold.js');   // fold() : repli des noms, partagé avec les pages
+
+let index = [];   // Lignes brutes reçues du thread principal
+let noms  = [];   // Noms repliés (sans accents, minuscules, séparateurs → espace)
+let mots  = [];   // Paires à plat [ligne, décalage] triées par noms[ligne].slice(décalage)
+let cps   = [];   // Lignes triées par code postal
 
 /**
- * Normalise une chaîne : minuscules, suppression des diacritiques, trim.
+ * Fallback si data/search.json est absent : même structure que build_search_index().
  */
-function normalize(str) {
-  return str
-    .toLowerCase()
-    .normalize('NFD')
-    .replace(/[\u0300-\u036f]/g, '')
-    .trim();
+function buildSearch(rows) {
+  const n = rows.map(c => fold(c[0]));
+  const starts = [];
+  n.forEach((nom, i) => {
+    starts.push([i, 0]);
+    for (let k = nom.indexOf(' '); k !== -1; k = nom.indexOf(' ', k + 1)) starts.push([i, k + 1]);
+  });
+  const key = ([i, off]) => n[i].slice(off);
+  starts.sort((a, b) => (key(a) < key(b) ? -1 : key(a) > key(b) ? 1 : 0));
+  const cp = rows.map((_, i) => i).sort((a, b) => {
+    const x = String(rows[a][2] || ''), y = String(rows[b][2] || '');
+    return x < y ? -1 : x > y ? 1 : 0;
+  });
+  return { n: rows.length, noms: n, mots: starts.flat(), cp };
+}
+
+/** Premier indice de [0, n) pour lequel keyAt(i) >= q (tableau trié). */
+function lowerBound(n, keyAt, q) {
+  let lo = 0, hi = n;
+  while (lo < hi) {
+    const mid = (lo + hi) >>> 1;
+    if (keyAt(mid) < q) lo = mid + 1; else hi = mid;
+  }
+  return lo;
 }
 
 /**
  * Score de pertinence pour trier les résultats.
- * Préfixe exact > début de mot > contient > partiel
+ * Nom exact > code INSEE exact > préfixe du nom > début de mot > code postal
  */
-function score(normName, normQuery) {
-  if (normName === normQuery)           return 100;
-  if (normName.startsWith(normQuery))   return 80;
-  const words = normName.split(/[-\s]+/);
-  if (words.some(w => w.startsWith(normQuery))) return 60;
-  if (normName.includes(normQuery))     return 40;
-  return 0;
+function search(q) {
+  const scores = new Map();
+  const put = (i, s) => { if (!(scores.get(i) >= s)) scores.set(i, s); };
+
+  // Débuts de mot : dichotomie puis parcours tant que le préfixe correspond
+  const m = mots.length / 2;
+  for (let k = lowerBound(m, j => noms[mots[2 * j]].slice(mots[2 * j + 1]), q); k < m; k++) {
+    const i = mots[2 * k], off = mots[2 * k + 1];
+    if (!noms[i].startsWith(q, off)) break;
+    put(i, off ? 60 : noms[i] === q ? 100 : 80);
+  }
+
+  // Code INSEE exact (lignes triées par code INSEE ; 2A/2B en majuscules)
+  const code = q.toUpperCase();
+  const c = lowerBound(index.length, i => String(index[i][1]), code);
+  if (c < index.length && String(index[c][1]) === code) put(c, 90);
+
+  // Préfixe de code postal
+  if (q.length >= 2) {
+    for (let k = lowerBound(cps.length, j => String(index[cps[j]][2] || ''), q); k < cps.length; k++) {
+      if (!String(index[cps[k]][2] || '').startsWith(q)) break;
+      put(cps[k], 20);
+    }
+  }
+  return scores;
 }
 
 self.onmessage = function (e) {
   const { type, payload } = e.data;
 
   if (type === 'INIT') {
-    index = payload;
-    // Pré-calcul des noms normalisés une seule fois
-    normalized = index.map(c => normalize(c[0]));
+    const rows = Array.isArray(payload) ? payload : payload.rows;
+    let s = Array.isArray(payload) ? null : payload.search;
+    if (!s || s.n !== rows.length) s = buildSearch(rows);
+    index = rows;
+    noms  = s.noms;
+    mots  = s.mots;
+    cps   = s.cp;
     self.postMessage({ type: 'READY', payload: { size: index.length } });
     return;
   }
 
   if (type === 'SEARCH') {
     const { query, limit = 8, ch = 'S' } = payload;
-    const q = normalize(query);
+    const q = fold(query);
 
     if (q.length < 1) {
       self.postMessage({ type: 'RESULTS', payload: { results: [], ch } });
@@ -61,26 +106,14 @@ self.onmessage = function (e) {
     }
 
     const results = [];
-
-    for (let i = 0; i < normalized.length; i++) {
-      const normName = normalized[i];
-      // Vérification rapide : contient-il au moins le début de la requête ?
-      if (!normName.includes(q) && !normalized[i].startsWith(q)) {
-        // Vérification secondaire sur code postal
-        const cp = index[i][2] || '';
-        if (!cp.startsWith(q)) continue;
-      }
-
-      const s = score(normName, q);
-      if (s > 0 || (index[i][2] || '').startsWith(q)) {
-        results.push({
-          nom:        index[i][0],
-          code_insee: index[i][1],
-          cp:         index[i][2],
-          pop:        index[i][3],
-          _score:     s || 20,
-        });
-      }
+    for (const [i, s] of search(q)) {
+      results.push({
+        nom:        String(index[i][0]),
+        code_insee: String(index[i][1]),   // TOUJOURS String
+        cp:         String(index[i][2] || ''),
+        pop:        index[i][3] || 0,
+        _score:     s,
+      });
     }
 
     // Tri par score décroissant, puis population décroissante
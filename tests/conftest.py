@@ -0,0 +1,56 @@
+import json
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# update.py est un script à la racine du dépôt, pas un paquet installé
+sys.path.insert(0, str(ROOT))
+
+import update   # noqa: E402
+
+
+@pytest.fixture
+def run_js():
+    """
+    Évalue `expr` dans node après les scripts frontend `scripts` (chemins
+    relatifs à la racine), avec `data` (sérialisable JSON) en variable globale ;
+    retourne le résultat relu en JSON. Test ignoré si node est absent.
+    """
+    node = shutil.which("node")
+    if node is None:
+        pytest.skip("node absent")
+
+    def run(scripts: list[str], expr: str, data=None):
+        source = "".join((ROOT / s).read_text(encoding="utf-8") + "\n" for s in scripts)
+        program = (
+            f"const data = JSON.parse(require('fs').readFileSync(0, 'utf8'));\n{source}\n"
+            f"process.stdout.write(JSON.stringify({expr}));\n"
+        )
+        out = subprocess.run(
+            [node, "-e", program], input=json.dumps(data), capture_output=True,
+            text=True, encoding="utf-8", check=True,
+        )
+        return json.loads(out.stdout)
+
+    return run
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """
+    data/ redirigé vers un répertoire temporaire : hashes.json, manifest.json
+    et son historique y sont écrits ; --compress et --hashed désactivés.
+    """
+    monkeypatch.setattr(update, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(update, "OUTPUT_MANIFEST", tmp_path / "hashes.json")
+    monkeypatch.setattr(update, "ARTIFACT_MANIFEST", tmp_path / "manifest.json")
+    monkeypatch.setattr(update, "MANIFEST_HISTORY", tmp_path / "manifest.history.json")
+    monkeypatch.setattr(update, "_output_manifest", None)
+    monkeypatch.setitem(update.COMPRESSION, "enabled", False)
+    monkeypatch.setitem(update.HASHED, "enabled", False)
+    return tmp_path
@@ -0,0 +1,31 @@
+"""Fenêtre ATMO : dernier mois complet, version du checkpoint air."""
+from datetime import date
+
+import pytest
+
+import update
+
+
+@pytest.mark.parametrize("year, today, month", [
+    (2025, date(2026, 10, 17), 12),   # année révolue
+    (2025, date(2026, 1, 2), 11),     # décembre pas encore consolidé
+    (2025, date(2026, 1, 4), 12),
+    (2026, date(2026, 10, 17), 9),
+    (2026, date(2026, 10, 3), 8),
+    (2026, date(2026, 1, 10), 0),     # aucun mois clos
+])
+def test_atmo_last_month(year, today, month):
+    assert update.atmo_last_month(year, today) == month
+
+
+def test_window_ends_with_last_complete_month(monkeypatch):
+    monkeypatch.setattr(update, "atmo_last_month", lambda year, today=None: 2)
+    assert update.atmo_wfs_params(2024, hits=True)["CQL_FILTER"].endswith("date_ech <= '2024-02-29'")
+    monkeypatch.setattr(update, "atmo_last_month", lambda year, today=None: 12)
+    params = update.atmo_wfs_params(2025, 0, 10)
+    assert params["CQL_FILTER"].endswith("date_ech <= '2025-12-31'")
+
+
+def test_version_stable_within_a_month():
+    versions = {update.atmo_last_month(2026, date(2026, 10, d)) for d in range(4, 32)}
+    assert versions == {9}
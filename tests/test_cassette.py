@@ -0,0 +1,52 @@
+"""Enregistrement des cassettes HTTP (--record)."""
+import hashlib
+import io
+import tracemalloc
+
+import requests
+
+import update
+
+SIZE  = 16 << 20
+BLOCK = bytes(range(256)) * 256   # 64 Kio
+
+
+class _Generated(io.RawIOBase):
+    """Corps de SIZE octets produit à la demande (jamais présent en entier en mémoire)."""
+
+    def __init__(self):
+        self.sent = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        n = min(size if size > 0 else SIZE, len(BLOCK), SIZE - self.sent)
+        self.sent += n
+        return BLOCK[:n]
+
+
+def test_record_streams_body_to_cassette(tmp_path, monkeypatch):
+    (tmp_path / "bodies").mkdir()
+    monkeypatch.setitem(update.CASSETTE, "dir", tmp_path)
+    monkeypatch.setattr(update, "_cassette_entries", {})
+
+    r = requests.Response()
+    r.status_code, r.raw = 200, _Generated()
+    r.request = requests.Request("GET", "https://example.org/f.bin").prepare()
+    tracemalloc.start()
+    update._record_response(r)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < SIZE // 8, f"pic de {peak} octets : corps chargé en mémoire"
+
+    (entry,) = update._cassette_entries["GET https://example.org/f.bin"]
+    path = tmp_path / "bodies" / entry["body"]
+    assert path.stat().st_size == SIZE
+    assert not list((tmp_path / "bodies").glob("*.tmp"))
+    # L'appelant relit le corps depuis le fichier de la cassette
+    sha1 = hashlib.sha1()
+    for chunk in r.iter_content(chunk_size=1 << 16):
+        sha1.update(chunk)
+    assert sha1.hexdigest() == entry["body"]
+    r.close()
@@ -0,0 +1,72 @@
+"""Repli des noms : fold_name() (update.py) ↔ fold() (fold.js) et les deux workers."""
+import random
+import re
+
+import update
+from conftest import ROOT
+
+NAMES = [
+    "L'Abergement-Clémenciat", "Saint-Étienne", "Œuilly", "Cœuvres-et-Valsery", "Ægypte",
+    "L’Haÿ-les-Roses", "Saint-Martin-d'Hères", "Pont-l'Évêque", "Châteauneuf-du-Pape",
+    "Çà-et-là", "  Le  Puy--en-Velay ", "Les Trois-Bassins", "Saint-Barthélemy", "ÎLE-D'YEU",
+    "Straße", "İstanbul", "ΟΔΟΣ", "Nouméa (NC)", "﻿BOM ligne", "x\x1cy\x85z",
+]
+# Alphabet des noms de communes (Latin-1, Latin étendu A, combinants) et séparateurs
+ALPHABET = (
+    [chr(c) for c in range(0x20, 0x7F)] + [chr(c) for c in range(0xA0, 0x180)]
+    + [chr(c) for c in range(0x300, 0x370)]
+    + list("\t\n’‘–   　﻿\x1c\x85")
+)
+
+
+def _random_names(n: int) -> list[str]:
+    rnd = random.Random(20240601)
+    return ["".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(1, 24))) for _ in range(n)]
+
+
+def test_fold_name_matches_js(run_js):
+    names = NAMES + _random_names(5000)
+    assert run_js(["fold.js"], "data.map(fold)", names) == [update.fold_name(n) for n in names]
+
+
+WORKERS = """
+function worker(src) {
+  const self = { postMessage: m => { self.last = m; } };
+  new Function('self', 'importScripts', src)(self, () => {});   // fold() déjà global (fold.js)
+  return self;
+}
+const WORKER_SRC = %s;
+const file = require('fs').readFileSync(%r, 'utf8');
+const out = {};
+for (const [label, src] of [['fichier', file], ['inline', WORKER_SRC]]) {
+  for (const withIndex of [true, false]) {
+    const w = worker(src);
+    w.onmessage({ data: { type: 'INIT', payload: { rows: data.rows, search: withIndex ? data.search : null } } });
+    out[label + (withIndex ? '+index' : '')] = data.queries.map(query => {
+      w.onmessage({ data: { type: 'SEARCH', payload: { query, limit: 10 } } });
+      return w.last.payload.results.map(r => r.code_insee);
+    });
+  }
+}
+"""
+
+
+def test_workers_agree(run_js):
+    html = (ROOT / "index.html").read_text(encoding="utf-8")
+    inline = re.search(r"const WORKER_SRC = (`.*?`);", html, re.S).group(1)
+    rows = sorted(
+        ([name, f"{i:05d}", f"{(i * 7919) % 95000 + 1000:05d}", i * 37 % 5000, None]
+         for i, name in enumerate(NAMES + _random_names(300), start=1001)),
+        key=lambda r: r[1],
+    )
+    queries = ["saint", "l hay", "LES", "œ", "cha", "0", "01", "1004", "étienne", "pont l"] + [
+        update.fold_name(r[0])[:3] for r in rows[::25]
+    ]
+    data = {"rows": rows, "search": update.build_search_index(rows), "queries": queries}
+    program = WORKERS % (inline, str(ROOT / "search.worker.js"))
+    results = run_js(["fold.js"], f"(() => {{ {program}; return out; }})()", data)
+    assert len(results) == 4
+    expected = results["fichier+index"]
+    assert any(expected)
+    for label, found in results.items():
+        assert found == expected, label
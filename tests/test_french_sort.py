@@ -0,0 +1,21 @@
+"""french_sort_key() (tri `nom` de data/explorer.json) ↔ localeCompare(…, 'fr') du navigateur."""
+import json
+
+import update
+from conftest import ROOT
+
+# Paires que l'approximation doit départager comme ICU : ligatures, accents,
+# casse, ponctuation et espaces, chiffres
+TRICKY = [
+    "Oeuilly", "Œuilly", "oeuilly", "Éza", "Eza", "eza", "Èze", "L'Isle", "L’Isle", "Lisle",
+    "L Isle", "L-Isle", "Saint-Pée", "Saint-Pé", "Saint Pe", "Cote", "Côte", "coté", "côté",
+    "Cotes", "Ys", "Y", "Yèbles", "Ay", "Aÿ", "Ae", "Æ", "Straße", "Strasse", "10e Ville",
+    "1ère", "Abc", "ABC", "abc", "Ça", "Ca", "Çà", "Île", "Ile", "ïle",
+]
+
+
+def test_matches_locale_compare(run_js):
+    index = ROOT / "data" / "index.json"
+    names = TRICKY + ([r[0] for r in json.loads(index.read_text(encoding="utf-8"))] if index.exists() else [])
+    expected = run_js([], "data.slice().sort((a, b) => a.localeCompare(b, 'fr'))", names)
+    assert sorted(names, key=update.french_sort_key) == expected
@@ -0,0 +1,17 @@
+"""Requêtes résilientes : budget d'étape et mesures HTTP."""
+import pytest
+
+import update
+
+
+def test_exhausted_budget_sends_and_counts_nothing(monkeypatch):
+    def send(*args, **kwargs):
+        raise AssertionError("requête envoyée malgré le budget épuisé")
+
+    monkeypatch.setattr(update.SESSION, "get", send)
+    monkeypatch.setattr(update, "_stage_metrics", {})
+    monkeypatch.setitem(update.STAGE_BUDGETS, "test", -1)
+    with update.instrument_stage("test") as metrics, update.stage_budget("test"):
+        with pytest.raises(update.StageBudgetExceeded):
+            update._session_get("https://example.invalid/")
+    assert metrics["http_requests"] == 0
@@ -0,0 +1,17 @@
+"""Index colonnaire : encode_index_columns() ↔ decodeIndexColumns() (index-columns.js)."""
+import update
+
+ROWS = [
+    ["L'Abergement-Clémenciat", "01001", "01400", 779, 64],
+    ["Ajaccio", "2A004", "20000", 71361, 58],
+    ["Bastia", "2B033", "20200", 48503, None],
+    ["Paris", "75056", "75001", 2133111, 72],
+    ["Basse-Terre", "97105", "97100", 9854, 40],
+    ["Commune sans CP du département", "97501", "97133", 0, None],
+]
+
+
+def test_js_decoder_matches_reference(run_js):
+    encoded = update.encode_index_columns(ROWS)
+    assert update.decode_index_columns(encoded) == ROWS
+    assert run_js(["index-columns.js"], "decodeIndexColumns(data)", encoded) == ROWS
@@ -0,0 +1,35 @@
+"""data/manifest.json (--hashed) face aux passages sans --hashed."""
+import json
+
+import update
+
+
+def _run(files, hashed):
+    update._output_manifest = None
+    update.HASHED["enabled"] = hashed
+    for path, data in files.items():
+        update.write_json(path, data)
+    update.save_artifact_manifest()
+    update.save_output_manifest()
+
+
+def _manifest(data_dir):
+    return json.loads((data_dir / "manifest.json").read_text(encoding="utf-8"))["files"]
+
+
+def test_plain_run_drops_stale_entries(data_dir):
+    a, b = data_dir / "a.json", data_dir / "b.json"
+    _run({a: {"v": 1}, b: {"v": 1}}, hashed=True)
+    hashed_b = _manifest(data_dir)["b.json"]
+
+    # Sans --hashed : a.json change (entrée retirée), b.json inchangé (entrée gardée)
+    _run({a: {"v": 2}, b: {"v": 1}}, hashed=False)
+    files = _manifest(data_dir)
+    assert "a.json" not in files
+    assert files["b.json"] == hashed_b
+    assert (data_dir / hashed_b).exists()
+
+
+def test_plain_run_without_manifest_creates_none(data_dir):
+    _run({data_dir / "a.json": {"v": 1}}, hashed=False)
+    assert not (data_dir / "manifest.json").exists()
@@ -0,0 +1,43 @@
+"""Écriture des artefacts de data/ : empreintes et siblings compressés."""
+import gzip
+
+import update
+
+
+def _run(path, data, compress):
+    """Un passage : écriture, compression, manifeste (relu comme au run suivant)."""
+    update._output_manifest = None
+    update.COMPRESSION["enabled"] = compress
+    update.write_json(path, data)
+    update.wait_compression()
+    update.save_output_manifest()
+
+
+def test_siblings_follow_content(data_dir):
+    path = data_dir / "x.json"
+    gz   = data_dir / "x.json.gz"
+
+    _run(path, {"v": 1}, compress=True)
+    assert gzip.decompress(gz.read_bytes()) == path.read_bytes()
+
+    # Réécrit sans --compress → siblings supprimés plutôt que servis périmés
+    _run(path, {"v": 2}, compress=False)
+    assert not gz.exists()
+
+    # Contenu inchangé mais siblings absents → régénérés
+    _run(path, {"v": 2}, compress=True)
+    assert gzip.decompress(gz.read_bytes()) == path.read_bytes()
+
+
+def test_stale_siblings_regenerated(data_dir):
+    path = data_dir / "x.json"
+    gz   = data_dir / "x.json.gz"
+
+    _run(path, {"v": 1}, compress=True)
+    gz.write_bytes(gzip.compress(b'{"v":0}'))   # sibling d'une autre version
+    manifest = update._load_output_manifest()
+    manifest["x.json"]["siblings"] = "0" * 64
+    update.save_output_manifest()
+
+    _run(path, {"v": 1}, compress=True)
+    assert gzip.decompress(gz.read_bytes()) == path.read_bytes()
@@ -0,0 +1,71 @@
+"""Rafraîchissement des sources : checkpoint de repli, issue notée, meta.json."""
+import json
+
+import pytest
+
+import update
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(update, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(update, "STAGE_DIR", tmp_path / "stages")
+    monkeypatch.setattr(update, "SCHEDULE_FILE", tmp_path / "schedule.json")
+    monkeypatch.setitem(update.CHECKPOINTS, "enabled", True)
+    return tmp_path
+
+
+def _fail():
+    raise RuntimeError("source indisponible")
+
+
+def test_success_is_checkpointed(cache_dir):
+    assert update._refreshing("crime", lambda: {"01001": 1})() == {"01001": 1}
+    assert update.load_stage_output("crime") == {"01001": 1}
+    assert update.stale_sources() == {}
+
+
+@pytest.mark.parametrize("fn, status", [(_fail, "failed"), (dict, "empty")])
+def test_previous_checkpoint_reused_and_reported(cache_dir, fn, status):
+    update._refreshing("crime", lambda: {"01001": 1})()
+    saved_at = update.stage_meta("crime")["saved_at"]
+
+    assert update._refreshing("crime", fn)() == {"01001": 1}
+    stale = update.stale_sources()
+    assert stale["crime"]["status"] == status
+    assert stale["crime"]["checkpoint_saved_at"] == saved_at
+
+    # Un succès suivant efface le signalement
+    update._refreshing("crime", lambda: {"01001": 2})()
+    assert update.stale_sources() == {}
+
+
+def test_empty_without_checkpoint(cache_dir):
+    assert update._refreshing("air", dict)() == {}
+    stale = update.stale_sources()["air"]
+    assert (stale["status"], stale["checkpoint_saved_at"]) == ("empty", None)
+    with pytest.raises(RuntimeError):
+        update._refreshing("socio", _fail)()
+    assert update.stale_sources()["socio"]["status"] == "failed"
+
+
+def test_version_reuse_bounded_by_max_age(cache_dir):
+    update.save_stage_output("dvf", {"01001": 1}, version="2024:34000")
+    assert update.reuse_checkpoint("dvf", "2024:34000", max_age=3600) == {"01001": 1}
+    update._reused.discard("dvf")
+
+    # Même version, checkpoint plus vieux que max_age → la source est relue
+    meta = {**update.stage_meta("dvf"), "saved_at": "2020-01-01T00:00:00Z"}
+    update._stage_meta_path("dvf").write_text(json.dumps(meta), encoding="utf-8")
+    assert update.reuse_checkpoint("dvf", "2024:34000", max_age=3600) is None
+    assert update.reuse_checkpoint("dvf", "2024:34000") == {"01001": 1}
+    update._reused.discard("dvf")
+
+
+def test_fuel_failure_propagates_and_is_reported(cache_dir):
+    update._refreshing("fuel", lambda: 9000)()
+    with pytest.raises(RuntimeError):
+        update._refreshing("fuel", _fail)()
+    stale = update.stale_sources()["fuel"]
+    # Pas de checkpoint carburants : date du carburants.json encore publié
+    assert stale["status"] == "failed" and stale["checkpoint_saved_at"] is not None
@@ -0,0 +1,52 @@
+"""Parité du calcul par lots compute_vivrescores() avec compute_vivrescore()."""
+import random
+
+import update
+
+# Valeurs aux seuils des paliers et juste à côté, plus des tirages uniformes
+_EDGES = {
+    dim: [v + d for v in seuils for d in (-0.05, 0, 0.05)]
+    for dim, (_, seuils) in update.VIVRESCORE_DIMENSIONS.items()
+}
+_RANGES = {"fibre": (0, 100), "crime": (0, 60), "air": (0, 6), "revenu": (8000, 45000), "pauvrete": (0, 50)}
+
+
+def _value(rnd: random.Random, dim: str):
+    r = rnd.random()
+    if r < 0.3:
+        return rnd.choice(_EDGES[dim])
+    lo, hi = _RANGES[dim]
+    return round(rnd.uniform(lo, hi), 1)
+
+
+def _commune(rnd: random.Random):
+    """(fibre, crime, air, socio) avec dimensions absentes et indicateurs manquants."""
+    fibre = None if rnd.random() < 0.2 else _value(rnd, "fibre")
+    crime = air = socio = None
+    if rnd.random() < 0.8:
+        crime = {"taux_pour_mille": None if rnd.random() < 0.1 else _value(rnd, "crime")}
+    if rnd.random() < 0.8:
+        air = {"iqa_moyen": rnd.choice([None, 0.0]) if rnd.random() < 0.1 else _value(rnd, "air")}
+    if rnd.random() < 0.8:
+        socio = {
+            "revenu_median": None if rnd.random() < 0.2 else _value(rnd, "revenu"),
+            "taux_pauvrete": None if rnd.random() < 0.3 else _value(rnd, "pauvrete"),
+        }
+    return fibre, crime, air, socio
+
+
+def test_batch_matches_reference():
+    rnd = random.Random(20240601)
+    communes = [_commune(rnd) for _ in range(20_000)]
+
+    inputs = [update.vivrescore_inputs(*c) for c in communes]
+    batch  = update.compute_vivrescores(update.vivrescore_columns(inputs))
+
+    for (fibre, crime, air, socio), inp, score in zip(communes, inputs, batch):
+        assert score == update.compute_vivrescore(fibre, crime, air, socio, inp["pauvrete"]), (fibre, crime, air, socio)
+
+
+def test_no_dimension_gives_none():
+    inputs = [update.vivrescore_inputs(None, None, None, None)]
+    assert update.compute_vivrescores(update.vivrescore_columns(inputs)) == [None]
+    assert update.compute_vivrescore(None, None, None, None, None) is None
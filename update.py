@@ -3,15 +3,44 @@
 VivreÀ - Script de mise à jour des données des communes françaises.
 """
 
+import io
+import os
+import base64
+import re
 import json
 import sys
+import shutil
+import struct
+import tempfile
+import hashlib
 import time
+import random
 import logging
+import argparse
+import cProfile
+import threading
+import contextvars
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
 from pathlib import Path
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterator, NamedTuple, Optional
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import brotli   # optionnel : fichiers .br pré-compressés (pip install brotli)
+except ImportError:
+    brotli = None
+try:
+    import resource   # pic RSS (getrusage) ; absent sous Windows
+except ImportError:
+    resource = None
 
 # ---------------------------------------------------------------------------
 # Logging
@@ -35,14 +64,911 @@ FUEL_API  = "https://donnees.roulez-eco.fr/opendata/instantane"
 DATA_DIR    = Path("data")
 DETAILS_DIR = DATA_DIR / "details"
 INDEX_FILE  = DATA_DIR / "index.json"
+INDEX_COLUMNS_FILE = DATA_DIR / "index.cols.json"   # même index, encodage colonnaire
+SEARCH_FILE = DATA_DIR / "search.json"              # index de recherche préfixe (worker)
+EXPLORER_FILE = DATA_DIR / "explorer.json"          # permutations de tri + plages par département
 FUEL_FILE   = DATA_DIR / "carburants.json"
+FUEL_SHARD_DIR = DATA_DIR / "carburants"   # shards par préfixe de code postal
+FUEL_COMPACT_FILE = DATA_DIR / "carburants.compact.json"   # encodage colonnaire (--fuel-compact)
 META_FILE   = DATA_DIR / "meta.json"
+# Empreintes SHA-256 des fichiers générés (évite de réécrire un fichier inchangé)
+OUTPUT_MANIFEST = DATA_DIR / "hashes.json"
+# Budget de l'index (Mo transférés : taille compressée si --compress, brute sinon)
+INDEX_BUDGET_MB = 1.5
+
+# État local du pipeline (non committé) : curseurs de reprise, caches
+CACHE_DIR       = Path(".cache")
+DVF_CURSOR_FILE = CACHE_DIR / "dvf_cursor.jsonl"
+HTTP_CACHE_DIR  = CACHE_DIR / "http"
+STAGE_DIR       = CACHE_DIR / "stages"
+SCHEDULE_FILE   = CACHE_DIR / "schedule.json"
+RUN_STATE_FILE  = CACHE_DIR / "run.json"
+PROFILE_DIR     = CACHE_DIR / "profile"
+RUN_METRICS_FILE = CACHE_DIR / "run_metrics.json"   # mesures par étape du dernier run
 
 SESSION = requests.Session()
 SESSION.headers.update({"User-Agent": "VivreA-Bot/1.0 (+https://vivrea.vox-novalys.fr)"})
+# Pool de connexions dimensionné pour les requêtes concurrentes (cf. HOST_LIMITS)
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
+# Limites par hôte : requêtes simultanées max + débit (jetons/s, token bucket).
+# concurrency=1 → comportement séquentiel historique.
+HOST_LIMITS: dict[str, dict] = {
+    "geo.api.gouv.fr":         {"concurrency": 8, "rate": 20.0},
+    "apidf-preprod.cerema.fr": {"concurrency": 4, "rate": 6.0},
+    "data.atmo-france.org":    {"concurrency": 4, "rate": 4.0},
+}
+DEFAULT_HOST_LIMIT = {"concurrency": 4, "rate": 10.0}
+
+
+# ---------------------------------------------------------------------------
+# Concurrence réseau (limites par hôte)
+# ---------------------------------------------------------------------------
+
+class TokenBucket:
+    """
+    Limiteur de débit thread-safe : `rate` jetons/s, rafale max `burst`.
+    acquire() bloque jusqu'à obtention d'un jeton (remplace les time.sleep fixes).
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate   = float(rate)
+        self.burst  = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.burst
+        self.stamp  = time.monotonic()
+        self.lock   = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp  = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_output_manifest: Optional[dict] = None
+_output_lock = threading.Lock()
+OUTPUT_STATS = {"written": 0, "unchanged": 0}
+
+_host_limiters: dict[str, tuple[threading.BoundedSemaphore, TokenBucket]] = {}
+_host_limiters_lock = threading.Lock()
+
+
+def configure_host_limits(concurrency: Optional[int] = None, rate: Optional[float] = None) -> None:
+    """Surcharge (CLI) la concurrence et le débit de tous les hôtes connus."""
+    for limits in [DEFAULT_HOST_LIMIT, *HOST_LIMITS.values()]:
+        if concurrency is not None:
+            limits["concurrency"] = max(1, concurrency)
+        if rate is not None:
+            limits["rate"] = rate
+    with _host_limiters_lock:
+        _host_limiters.clear()
+
+
+def _host_limiter(url: str) -> tuple[threading.BoundedSemaphore, TokenBucket]:
+    host = urlsplit(url).hostname or ""
+    with _host_limiters_lock:
+        limiter = _host_limiters.get(host)
+        if limiter is None:
+            limits  = HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)
+            limiter = (threading.BoundedSemaphore(limits["concurrency"]), TokenBucket(limits["rate"]))
+            _host_limiters[host] = limiter
+        return limiter
+
+
+def host_concurrency(url: str) -> int:
+    """Nombre de requêtes simultanées autorisées vers l'hôte de `url`."""
+    host = urlsplit(url).hostname or ""
+    return HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)["concurrency"]
+
+
+@contextmanager
+def host_slot(url: str):
+    """
+    Réserve un créneau (sémaphore) et un jeton de débit pour l'hôte de `url`
+    le temps d'une requête.
+    """
+    sem, bucket = _host_limiter(url)
+    with sem:
+        bucket.acquire()
+        yield
+
+
+# ---------------------------------------------------------------------------
+# Instrumentation (mesures par étape, --profile)
+# ---------------------------------------------------------------------------
+# Chaque étape s'exécute dans un contexte (contextvars) qui porte ses compteurs :
+# requêtes HTTP émises, octets reçus, hits/miss du cache disque. Les pools
+# imbriqués (StagePool) propagent ce contexte à leurs threads. En fin de run,
+# .cache/run_metrics.json (hors data/ : horodaté, il changerait à chaque run
+# committé) regroupe durée, compteurs, enregistrements produits et pic RSS de
+# chaque étape, comparés au run précédent dans le journal.
+# --profile cprofile → .cache/profile/{étape}.prof (pstats / snakeviz), tâches
+#                      des StagePool de l'étape comprises ;
+# --profile trace    → .cache/profile/trace.json (chrome://tracing, Perfetto).
+
+PROFILE = {"mode": None}
+_METRIC_KEYS   = ("http_requests", "http_retries", "bytes_downloaded", "cache_hits", "cache_misses")
+_stage_metrics: dict[str, dict] = {}
+_trace_events:  list[dict] = []
+_metrics_lock  = threading.Lock()
+_current_stage: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("stage", default=None)
+# Profileurs des tâches StagePool de l'étape en cours (--profile cprofile)
+_stage_profiles: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("profiles", default=None)
+
+
+class StagePool(ThreadPoolExecutor):
+    """ThreadPoolExecutor dont les tâches héritent du contexte de l'appelant (étape en cours)."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, _profiled, fn, *args, **kwargs)
+
+
+def _profiled(fn, *args, **kwargs):
+    """
+    Exécute une tâche de StagePool sous son propre cProfile si l'étape est
+    profilée : avant Python 3.12, un profileur ne voit que son thread.
+    """
+    profiles = _stage_profiles.get()
+    if profiles is None:
+        return fn(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:   # Python ≥ 3.12 : le profileur de l'étape couvre déjà tous les threads
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        with _metrics_lock:
+            profiles.append(profiler)
+
+
+def count_metric(key: str, n: int = 1) -> None:
+    """Ajoute `n` au compteur `key` de l'étape en cours (sans effet hors étape)."""
+    m = _current_stage.get()
+    if m is not None:
+        with _metrics_lock:
+            m[key] += n
+
+
+def _metered(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """
+    Compte les octets reçus en parcourant un itérateur de morceaux (iter_content)
+    et interrompt un transfert qui dépasse le budget de l'étape (check_budget).
+    """
+    for chunk in chunks:
+        count_metric("bytes_downloaded", len(chunk))
+        check_budget()
+        yield chunk
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Pic de mémoire résidente du processus (Mo), None si indisponible."""
+    try:
+        # Linux : VmHWM est propre au processus (ru_maxrss hérite du parent après fork/exec)
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def trace_event(name: str, cat: str, begin: float, args: Optional[dict] = None) -> None:
+    """Enregistre une tranche [begin, maintenant] (perf_counter) si --profile trace."""
+    if PROFILE["mode"] != "trace":
+        return
+    end = time.perf_counter()
+    event = {
+        "name": name, "cat": cat, "ph": "X", "pid": os.getpid(),
+        "tid":  threading.current_thread().name,
+        "ts":   round(begin * 1e6), "dur": round((end - begin) * 1e6),
+    }
+    if args:
+        event["args"] = args
+    with _metrics_lock:
+        _trace_events.append(event)
+
+
+def _record_count(value) -> Optional[int]:
+    """Nombre d'enregistrements produits par une étape (taille du résultat)."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
 
-RETRY_DELAY = 2
-MAX_RETRIES = 3
+@contextmanager
+def instrument_stage(name: str):
+    """
+    Mesure une étape : les compteurs sont rattachés au contexte courant, le
+    dictionnaire produit est complété par l'appelant (`records`, `status`).
+    """
+    import pstats
+
+    m = dict.fromkeys(_METRIC_KEYS, 0)
+    token = _current_stage.set(m)
+    profiler, profiles = None, []
+    if PROFILE["mode"] == "cprofile":
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:   # Python ≥ 3.12 : un seul profileur actif à la fois
+            log.warning("%s : profileur déjà actif, étape non profilée", name)
+            profiler = None
+    profiles_token = _stage_profiles.set(profiles if profiler is not None else None)
+    begin = time.perf_counter()
+    try:
+        yield m
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            stats = pstats.Stats(profiler)
+            for worker in profiles:   # tâches des StagePool de l'étape
+                stats.add(worker)
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            stats.dump_stats(PROFILE_DIR / f"{name}.prof")
+        trace_event(name, "stage", begin)
+        _stage_profiles.reset(profiles_token)
+        _current_stage.reset(token)
+        m["wall_s"]      = round(time.perf_counter() - begin, 3)
+        m["peak_rss_mb"] = peak_rss_mb()
+        with _metrics_lock:
+            _stage_metrics[name] = m
+
+
+def reset_metrics() -> None:
+    with _metrics_lock:
+        _stage_metrics.clear()
+        _trace_events.clear()
+
+
+def write_run_metrics(run_id: Optional[str], duration: float) -> None:
+    """
+    Écrit .cache/run_metrics.json (et la trace si --profile trace) et journalise
+    l'écart de durée de chaque étape avec le run précédent.
+    """
+    try:
+        with open(RUN_METRICS_FILE, encoding="utf-8") as f:
+            previous = json.load(f).get("stages", {})
+    except (OSError, ValueError):
+        previous = {}
+    with _metrics_lock:
+        order  = sorted(_stage_metrics, key=lambda n: STAGE_ORDER.index(n) if n in STAGE_ORDER else len(STAGE_ORDER))
+        stages = {name: dict(_stage_metrics[name]) for name in order}
+        events = list(_trace_events)
+
+    log.info("Mesures par étape :")
+    for name, m in stages.items():
+        before = (previous.get(name) or {}).get("wall_s")
+        delta  = f" (précédent {before:.1f} s)" if isinstance(before, (int, float)) else ""
+        log.info("  %-9s %6.1f s%s – %d requêtes, %.1f Mo reçus, %d hits cache, %s enr.",
+                 name, m["wall_s"], delta, m["http_requests"],
+                 m["bytes_downloaded"] / 1e6, m["cache_hits"],
+                 "–" if m.get("records") is None else m["records"])
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    RUN_METRICS_FILE.write_text(json.dumps({
+        "run_id":      run_id,
+        "finished_at": datetime.utcnow().isoformat() + "Z",
+        "duration_s":  round(duration, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "outputs":     dict(OUTPUT_STATS),
+        "stages":      stages,
+    }, indent=2), encoding="utf-8")
+
+    if PROFILE["mode"] == "trace" and events:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        trace = PROFILE_DIR / "trace.json"
+        trace.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf-8")
+        log.info("Trace : %s (%d événements)", trace, len(events))
+    elif PROFILE["mode"] == "cprofile":
+        log.info("Profils cProfile : %s/{étape}.prof", PROFILE_DIR)
+
+
+# ---------------------------------------------------------------------------
+# Requêtes résilientes (réessais, disjoncteur, budget par étape)
+# ---------------------------------------------------------------------------
+# Toutes les requêtes de SESSION passent par _session_get() : API JSON
+# (safe_get) comme gros téléchargements (open_download).
+#   - erreur réseau ou statut RETRY_STATUSES → nouvel essai après un backoff
+#     exponentiel à jitter complet, ou après le délai Retry-After annoncé ;
+#   - disjoncteur par hôte : après CIRCUIT["threshold"] échecs consécutifs,
+#     les requêtes vers cet hôte échouent immédiatement (CircuitOpen) pendant
+#     CIRCUIT["cooldown"] s, puis une requête d'essai est autorisée ;
+#   - budget de temps par étape (STAGE_BUDGETS, --budget) : les délais
+#     d'attente sont bornés par le temps restant, une étape hors budget
+#     échoue (StageBudgetExceeded) et garde sa valeur de repli.
+# Les attentes ont lieu dans le créneau de l'hôte (host_slot) : un 429 ou
+# un Retry-After ralentit toutes les requêtes vers cet hôte.
+
+RETRY = {"attempts": 3, "base": 1.0, "cap": 30.0, "max_wait": 60.0, "connect_timeout": 10.0}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CIRCUIT = {"threshold": 5, "cooldown": 60.0}
+
+# Durée max de chaque étape (s) ; 0 = sans limite
+STAGE_BUDGETS: dict[str, int] = {
+    "communes": 300,
+    "dvf":      900,
+    "fibre":    600,
+    "fuel":     120,
+    "crime":    600,
+    "air":      900,   # année complète : ≈ 12,8 M indices, 128 pages WFS (≈ 435 Mo de CSV)
+    "socio":    300,
+}
+
+_stage_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+_circuits: dict[str, dict] = {}
+_circuits_lock = threading.Lock()
+
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    """Hôte en échec répété : requête refusée sans appel réseau."""
+
+
+class StageBudgetExceeded(requests.exceptions.Timeout):
+    """Budget de temps de l'étape en cours épuisé."""
+
+
+@contextmanager
+def stage_budget(name: str):
+    """Fixe l'échéance de l'étape `name` (héritée par les StagePool)."""
+    budget = STAGE_BUDGETS.get(name)
+    token  = _stage_deadline.set(time.monotonic() + budget if budget else None)
+    try:
+        yield
+    finally:
+        _stage_deadline.reset(token)
+
+
+def budget_remaining() -> Optional[float]:
+    """Secondes restantes avant l'échéance de l'étape en cours (None = sans limite)."""
+    deadline = _stage_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_budget(url: str = "") -> Optional[float]:
+    """Lève StageBudgetExceeded si l'échéance est passée ; retourne le temps restant."""
+    remaining = budget_remaining()
+    if remaining is not None and remaining <= 0:
+        raise StageBudgetExceeded(f"budget de l'étape épuisé {url}".rstrip())
+    return remaining
+
+
+def _circuit_check(host: str) -> None:
+    with _circuits_lock:
+        c = _circuits.get(host)
+        if not c or c["failures"] < CIRCUIT["threshold"]:
+            return
+        if time.monotonic() - c["opened_at"] < CIRCUIT["cooldown"]:
+            raise CircuitOpen(f"{host} : disjoncteur ouvert ({c['failures']} échecs consécutifs)")
+        c["opened_at"] = time.monotonic()   # semi-ouvert : cette requête sert d'essai
+
+
+def _circuit_result(host: str, ok: bool) -> None:
+    with _circuits_lock:
+        if ok:
+            c = _circuits.pop(host, None)
+            if c and c["failures"] >= CIRCUIT["threshold"]:
+                log.info("%s : disjoncteur refermé", host)
+            return
+        c = _circuits.setdefault(host, {"failures": 0, "opened_at": 0.0})
+        c["failures"] += 1
+        if c["failures"] >= CIRCUIT["threshold"]:
+            if c["failures"] == CIRCUIT["threshold"]:
+                log.warning("%s : disjoncteur ouvert pour %.0f s (%d échecs consécutifs)",
+                            host, CIRCUIT["cooldown"], c["failures"])
+            c["opened_at"] = time.monotonic()
+
+
+def _retry_after(r: requests.Response) -> Optional[float]:
+    """Délai Retry-After d'une réponse (secondes ou date HTTP), None si absent."""
+    value = r.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_sleep(attempt: int, url: str, retry_after: Optional[float] = None) -> None:
+    """Attend avant l'essai suivant (Retry-After ou backoff à jitter complet), dans le budget."""
+    if retry_after is not None:
+        delay = min(retry_after, RETRY["max_wait"])
+    else:
+        delay = random.uniform(0, min(RETRY["cap"], RETRY["base"] * 2 ** (attempt - 1)))
+    remaining = check_budget(url)
+    if remaining is not None and delay >= remaining:
+        raise StageBudgetExceeded(f"budget de l'étape insuffisant pour réessayer {url}")
+    count_metric("http_retries")
+    time.sleep(delay)
+
+
+def _request_timeout(timeout, url: str) -> tuple[float, float]:
+    """(connexion, lecture) : connexion courte, les deux bornées par le budget restant."""
+    connect, read = timeout if isinstance(timeout, tuple) else (min(RETRY["connect_timeout"], timeout), timeout)
+    remaining = check_budget(url)
+    if remaining is not None:
+        connect, read = min(connect, remaining), min(read, remaining)
+    return connect, read
+
+
+# ---------------------------------------------------------------------------
+# Cache HTTP disque (revalidation ETag / Last-Modified)
+# ---------------------------------------------------------------------------
+# Corps stockés dans HTTP_CACHE_DIR/{clé}.body, métadonnées dans {clé}.json.
+# Revalidation conditionnelle (If-None-Match / If-Modified-Since → 304).
+# Ressources data.gouv.fr : si checksum + last_modified annoncés par
+# /api/1/datasets/{slug}/ n'ont pas changé, aucune requête n'est émise.
+# Éviction LRU (mtime) au-delà de HTTP_CACHE["max_bytes"]. --no-cache → désactivé.
+
+HTTP_CACHE = {"enabled": True, "max_bytes": 1024 * 1024 * 1024}
+_http_cache_lock = threading.Lock()
+
+
+def configure_http_cache(enabled: bool = True, max_mb: Optional[int] = None) -> None:
+    HTTP_CACHE["enabled"] = enabled
+    if max_mb is not None:
+        HTTP_CACHE["max_bytes"] = max_mb * 1024 * 1024
+
+
+def _cache_key(url: str, params: Optional[dict]) -> str:
+    query = json.dumps(sorted((params or {}).items()), default=str)
+    return hashlib.sha1(f"{url}?{query}".encode("utf-8")).hexdigest()
+
+
+def _resource_version(resource: Optional[dict]) -> Optional[str]:
+    """Version d'une ressource data.gouv.fr : checksum + last_modified (ou None)."""
+    if not resource:
+        return None
+    checksum = (resource.get("checksum") or {}).get("value")
+    modified = resource.get("last_modified")
+    if not checksum and not modified:
+        return None
+    return f"{checksum or ''}|{modified or ''}"
+
+
+def _cache_lookup(key: str) -> tuple[Path, Optional[dict]]:
+    body = HTTP_CACHE_DIR / f"{key}.body"
+    try:
+        with open(HTTP_CACHE_DIR / f"{key}.json", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return body, None
+    return body, (meta if body.exists() else None)
+
+
+def _cached_response(url: str, body: Path, meta: dict, state: str = "HIT") -> requests.Response:
+    """Reconstruit une réponse 200 depuis le disque (et la marque récemment utilisée)."""
+    os.utime(body)
+    r = requests.Response()
+    r.status_code = 200
+    r.url         = url
+    r._content    = body.read_bytes()
+    r.headers["Content-Type"] = meta.get("content_type") or ""
+    r.headers["X-Vivrea-Cache"] = state
+    return r
+
+
+def _evict_http_cache(keep: str) -> None:
+    """Supprime les entrées les moins récemment utilisées au-delà de la taille max."""
+    with _http_cache_lock:
+        bodies = sorted(HTTP_CACHE_DIR.glob("*.body"), key=lambda p: p.stat().st_mtime)
+        total  = sum(p.stat().st_size for p in bodies)
+        for body in bodies:
+            if total <= HTTP_CACHE["max_bytes"]:
+                break
+            if body.stem == keep:
+                continue
+            total -= body.stat().st_size
+            body.unlink(missing_ok=True)
+            (HTTP_CACHE_DIR / f"{body.stem}.json").unlink(missing_ok=True)
+            log.info("Cache : éviction %s", body.stem[:12])
+
+
+def _session_get(url: str, timeout=30, **kwargs) -> requests.Response:
+    """
+    SESSION.get en streaming avec réessais (voir « Requêtes résilientes »),
+    chaque essai compté dans les mesures de l'étape (et tracé). Retourne la
+    dernière réponse reçue, même en erreur ; lève requests.RequestException
+    si aucune réponse n'a pu être obtenue (réseau, disjoncteur, budget).
+    """
+    host    = urlsplit(url).netloc
+    attempt = 0
+    while True:
+        attempt += 1
+        _circuit_check(host)
+        # Budget épuisé → StageBudgetExceeded avant tout envoi : ni requête comptée, ni tracée
+        request_timeout = _request_timeout(timeout, url)
+        begin = time.perf_counter()
+        try:
+            r = SESSION.get(url, stream=True, timeout=request_timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            count_metric("http_requests")
+            trace_event(host or url, "http", begin, {"url": url, "error": type(e).__name__})
+            _circuit_result(host, False)
+            if attempt == RETRY["attempts"]:
+                raise
+            log.warning("Réseau : %s – %s (tentative %d/%d)", e, url, attempt, RETRY["attempts"])
+            _retry_sleep(attempt, url)
+            continue
+        count_metric("http_requests")
+        trace_event(host or url, "http", begin, {"url": r.url, "status": r.status_code})
+        if r.status_code not in RETRY_STATUSES:
+            _circuit_result(host, True)
+            return r
+        if r.status_code != 429:   # 429 : l'hôte répond, il demande seulement de ralentir
+            _circuit_result(host, False)
+        if attempt == RETRY["attempts"]:
+            return r
+        log.warning("HTTP %s – %s (tentative %d/%d)", r.status_code, url, attempt, RETRY["attempts"])
+        wait = _retry_after(r)
+        r.close()
+        _retry_sleep(attempt, url, wait)
+
+
+def _cache_fetch(
+    url:      str,
+    params:   Optional[dict],
+    timeout:  int,
+    headers:  Optional[dict],
+    resource: Optional[dict],
+    cache:    bool = True,
+) -> tuple[Optional[Path], Optional[dict], str, Optional[requests.Response]]:
+    """
+    Résout une requête via le cache. Retourne (corps sur disque, métadonnées,
+    "HIT"|"MISS", None) si le corps est servi ou stocké par le cache, sinon
+    (None, None, "BYPASS", réponse en streaming non encore lue).
+    `cache=False` : flux temps réel, ni revalidé ni stocké.
+    """
+    if not (HTTP_CACHE["enabled"] and cache):
+        with host_slot(url):
+            r = _session_get(url, params=params, timeout=timeout, headers=headers)
+        return None, None, "BYPASS", r
+
+    key        = _cache_key(url, params)
+    body, meta = _cache_lookup(key)
+    version    = _resource_version(resource)
+    if meta and version and meta.get("resource_version") == version:
+        log.info("Cache : %s inchangé (data.gouv.fr), téléchargement évité", url)
+        count_metric("cache_hits")
+        return body, meta, "HIT", None
+
+    req_headers = dict(headers or {})
+    if meta and meta.get("etag"):
+        req_headers["If-None-Match"] = meta["etag"]
+    if meta and meta.get("last_modified"):
+        req_headers["If-Modified-Since"] = meta["last_modified"]
+
+    with host_slot(url):
+        r = _session_get(url, params=params, timeout=timeout, headers=req_headers)
+        if r.status_code == 304 and meta:
+            r.close()
+            log.info("Cache : %s non modifié (304)", url)
+            count_metric("cache_hits")
+            return body, meta, "HIT", None
+        etag, modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+        if r.status_code != 200 or not (etag or modified or version):
+            return None, None, "BYPASS", r   # rien pour revalider : pas de stockage
+        try:
+            HTTP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = body.with_name(f"{key}.{threading.get_ident()}.tmp")
+            with open(tmp, "wb") as f:
+                for chunk in _metered(r.iter_content(chunk_size=1 << 20)):
+                    f.write(chunk)
+            os.replace(tmp, body)
+        finally:
+            r.close()
+
+    meta = {
+        "url":              url,
+        "params":           params,
+        "etag":             etag,
+        "last_modified":    modified,
+        "resource_version": version,
+        "content_type":     r.headers.get("Content-Type"),
+        "stored_at":        datetime.utcnow().isoformat() + "Z",
+    }
+    meta_path = HTTP_CACHE_DIR / f"{key}.json"
+    tmp = meta_path.with_name(f"{key}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(meta, ensure_ascii=False, default=str), encoding="utf-8")
+    os.replace(tmp, meta_path)
+    _evict_http_cache(keep=key)
+    count_metric("cache_misses")
+    return body, meta, "MISS", None
+
+
+def http_get(
+    url:      str,
+    params:   Optional[dict] = None,
+    timeout:  int = 30,
+    headers:  Optional[dict] = None,
+    resource: Optional[dict] = None,
+) -> requests.Response:
+    """
+    GET via le cache disque. `resource` : entrée `resources[]` data.gouv.fr
+    décrivant `url` (checksum / last_modified). Ne lève pas sur un statut
+    HTTP d'erreur : l'appelant garde la main (raise_for_status, status_code).
+    """
+    body, meta, state, r = _cache_fetch(url, params, timeout, headers, resource)
+    if body is None:
+        count_metric("bytes_downloaded", len(r.content))   # lecture complète, libère la connexion
+        return r
+    return _cached_response(url, body, meta, state)
+
+
+class _ChunkStream(io.RawIOBase):
+    """Flux binaire brut au-dessus d'un itérateur de morceaux (iter_content)."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buf    = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self.buf:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.buf = memoryview(chunk)
+        n = min(len(b), len(self.buf))
+        b[:n] = self.buf[:n]
+        self.buf = self.buf[n:]
+        return n
+
+
+@contextmanager
+def open_download(
+    url:      str,
+    params:   Optional[dict] = None,
+    timeout:  int = 30,
+    headers:  Optional[dict] = None,
+    resource: Optional[dict] = None,
+    seekable: bool = False,
+    cache:    bool = True,
+):
+    """
+    Ouvre le corps d'une réponse en flux binaire bufferisé (peek() disponible),
+    sans le charger en mémoire : fichier du cache disque, ou flux réseau
+    (--no-cache, `cache=False`). `seekable=True` (ZIP) : le flux réseau est
+    d'abord recopié dans un fichier temporaire. Lève requests.HTTPError si le
+    statut n'est pas 200.
+    """
+    body, meta, state, r = _cache_fetch(url, params, timeout, headers, resource, cache)
+    if body is not None:
+        os.utime(body)
+        with open(body, "rb") as f:
+            yield f
+        return
+    try:
+        r.raise_for_status()
+        stream = io.BufferedReader(_ChunkStream(_metered(r.iter_content(chunk_size=1 << 16))), buffer_size=1 << 20)
+        if not seekable:
+            yield stream
+            return
+        with tempfile.TemporaryFile() as tmp:
+            shutil.copyfileobj(stream, tmp, 1 << 20)
+            tmp.seek(0)
+            yield tmp
+    finally:
+        r.close()
+
+
+# ---------------------------------------------------------------------------
+# Cassettes HTTP (enregistrement / rejeu hors ligne)
+# ---------------------------------------------------------------------------
+# --record DIR : chaque réponse reçue par SESSION (redirections, erreurs WFS,
+# pages DVF…) est écrite dans DIR : corps dans bodies/{sha1}, index dans
+# cassette.json {version, recorded_at, entries: {"GET url": [réponses]}}.
+# --replay DIR : un serveur HTTP local rejoue ces réponses ; SESSION y est
+# redirigée par un adaptateur (l'URL d'origine est conservée dans la réponse).
+# Une même URL enregistrée plusieurs fois est rejouée dans l'ordre (la dernière
+# réponse se répète) ; les corps transmis en gzip sont recompressés au rejeu,
+# If-None-Match / If-Modified-Since reçoivent un 304. Les deux modes
+# désactivent le cache disque et les checkpoints : toutes les requêtes passent.
+
+CASSETTE_VERSION = 1
+CASSETTE = {"mode": None, "dir": None, "server": None}
+_cassette_entries: dict[str, list] = {}
+_cassette_lock = threading.Lock()
+_HOP_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection", "keep-alive"}
+
+
+def cassette_key(method: str, url: str) -> str:
+    """Clé d'une requête : méthode + URL, paramètres de requête triés."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{method} {parts.scheme}://{parts.netloc}{parts.path}" + (f"?{query}" if query else "")
+
+
+def _record_response(r: requests.Response, *args, **kwargs) -> None:
+    """
+    Hook `response` de SESSION : recopie le corps (décodé) en flux dans
+    bodies/, l'ajoute à la cassette, puis rend ce fichier à l'appelant comme
+    corps de la réponse — jamais chargé en entier en mémoire.
+    """
+    bodies = CASSETTE["dir"] / "bodies"
+    tmp    = bodies / f"recording.{threading.get_ident()}.tmp"
+    sha1   = hashlib.sha1()
+    with open(tmp, "wb") as f:
+        for chunk in r.iter_content(chunk_size=1 << 16):
+            sha1.update(chunk)
+            f.write(chunk)
+    digest = sha1.hexdigest()
+    path   = bodies / digest
+    os.replace(tmp, path)
+    # Connexion rendue au pool ; le corps est relu depuis la cassette
+    # (iter_content / content / raw)
+    r.close()
+    r.raw = open(path, "rb")
+    r._content, r._content_consumed = False, False
+    entry = {
+        "status":   r.status_code,
+        "headers":  {k: v for k, v in r.headers.items() if k.lower() not in _HOP_HEADERS},
+        "encoding": r.headers.get("Content-Encoding"),
+        "body":     digest,
+    }
+    with _cassette_lock:
+        _cassette_entries.setdefault(cassette_key(r.request.method, r.request.url), []).append(entry)
+
+
+def start_recording(directory: Path) -> None:
+    """Active l'enregistrement de toutes les réponses de SESSION dans `directory`."""
+    (directory / "bodies").mkdir(parents=True, exist_ok=True)
+    CASSETTE.update(mode="record", dir=directory)
+    try:
+        with open(directory / "cassette.json", encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous.get("version") == CASSETTE_VERSION:
+            _cassette_entries.update(previous["entries"])   # complète une cassette existante
+    except (OSError, ValueError):
+        pass
+    SESSION.hooks["response"].append(_record_response)
+    log.info("Enregistrement des réponses HTTP dans %s", directory)
+
+
+def save_cassette() -> None:
+    """Écrit l'index cassette.json (--record) ou résume le rejeu (--replay)."""
+    if CASSETTE["mode"] == "replay":
+        stats = CASSETTE["server"].stats
+        log.info("Rejeu : %d réponses servies, %d absentes de la cassette", stats["served"], stats["missing"])
+        return
+    if CASSETTE["mode"] != "record":
+        return
+    with _cassette_lock:
+        data = {
+            "version":     CASSETTE_VERSION,
+            "recorded_at": datetime.utcnow().isoformat() + "Z",
+            "entries":     dict(sorted(_cassette_entries.items())),
+        }
+    path = CASSETTE["dir"] / "cassette.json"
+    tmp  = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+    log.info("Cassette : %d URL, %d réponses enregistrées",
+             len(data["entries"]), sum(len(v) for v in data["entries"].values()))
+
+
+class _ReplayAdapter(HTTPAdapter):
+    """Envoie chaque requête au serveur de rejeu : {base}/{schéma}/{hôte}{chemin}?{requête}."""
+
+    def __init__(self, base: str, **kwargs):
+        super().__init__(**kwargs)
+        self.base = base
+
+    def send(self, request, **kwargs):
+        url   = request.url
+        parts = urlsplit(url)
+        request.url = f"{self.base}/{parts.scheme}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+        try:
+            r = super().send(request, **kwargs)
+        finally:
+            request.url = url
+        r.url = url   # redirections relatives résolues contre l'URL d'origine
+        return r
+
+
+def start_replay(directory: Path):
+    """
+    Démarre le serveur de rejeu de la cassette `directory` (thread démon) et y
+    redirige SESSION. Retourne le serveur (server.stats : served / missing).
+    """
+    import gzip
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    with open(directory / "cassette.json", encoding="utf-8") as f:
+        cassette = json.load(f)
+    if cassette.get("version") != CASSETTE_VERSION:
+        raise ValueError(f"Cassette {directory} : version {cassette.get('version')} "
+                         f"(attendue {CASSETTE_VERSION}), à réenregistrer")
+    entries = cassette["entries"]
+    served: dict[str, int] = {}
+    lock    = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            scheme, _, rest = self.path.lstrip("/").partition("/")
+            key = cassette_key(self.command, f"{scheme}://{rest}")
+            with lock:
+                responses = entries.get(key)
+                if responses:
+                    i = served.get(key, 0)
+                    served[key] = i + 1
+                    self.server.stats["served"] += 1
+                else:
+                    self.server.stats["missing"] += 1
+            if not responses:
+                log.warning("Rejeu : %s absente de la cassette", key)
+                return self._send(599, {"Content-Type": "text/plain"}, b"absente de la cassette")
+            entry   = responses[min(i, len(responses) - 1)]
+            headers = dict(entry["headers"])
+            lowered = {k.lower(): v for k, v in headers.items()}
+            etag, modified = lowered.get("etag"), lowered.get("last-modified")
+            if entry["status"] == 200 and (
+                (etag and self.headers.get("If-None-Match") == etag)
+                or (modified and self.headers.get("If-Modified-Since") == modified)
+            ):
+                return self._send(304, {k: v for k, v in headers.items() if k.lower() in ("etag", "last-modified")}, b"")
+            path = directory / "bodies" / entry["body"]
+            if entry.get("encoding") == "gzip" and "gzip" in self.headers.get("Accept-Encoding", ""):
+                headers["Content-Encoding"] = "gzip"
+                return self._send(entry["status"], headers, gzip.compress(path.read_bytes(), mtime=0))
+            self._send(entry["status"], headers, path)
+
+        def _send(self, status: int, headers: dict, body) -> None:
+            """Envoie `body` (octets, ou fichier de la cassette recopié en flux)."""
+            self.send_response_only(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body) if isinstance(body, bytes) else body.stat().st_size))
+            self.end_headers()
+            if isinstance(body, bytes):
+                self.wfile.write(body)
+                return
+            with open(body, "rb") as f:
+                shutil.copyfileobj(f, self.wfile, 1 << 20)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.stats = {"served": 0, "missing": 0}
+    threading.Thread(target=server.serve_forever, name="replay", daemon=True).start()
+    adapter = _ReplayAdapter(f"http://127.0.0.1:{server.server_port}", pool_connections=16, pool_maxsize=16)
+    SESSION.mount("http://", adapter)
+    SESSION.mount("https://", adapter)
+    CASSETTE.update(mode="replay", dir=directory, server=server)
+    log.info("Rejeu de la cassette %s (%d URL, enregistrée le %s) sur le port %d",
+             directory, len(entries), cassette.get("recorded_at"), server.server_port)
+    return server
 
 
 # ---------------------------------------------------------------------------
@@ -50,29 +976,320 @@ MAX_RETRIES = 3
 # ---------------------------------------------------------------------------
 
 def safe_get(url: str, params: dict = None, timeout: int = 30) -> Optional[dict]:
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            r = SESSION.get(url, params=params, timeout=timeout)
-            r.raise_for_status()
-            return r.json()
-        except requests.exceptions.HTTPError as e:
-            log.warning("HTTP %s – %s (tentative %d/%d)", e.response.status_code, url, attempt, MAX_RETRIES)
-        except requests.exceptions.RequestException as e:
-            log.warning("Réseau : %s – %s (tentative %d/%d)", e, url, attempt, MAX_RETRIES)
-        if attempt < MAX_RETRIES:
-            time.sleep(RETRY_DELAY * attempt)
+    """GET JSON (réessais dans _session_get) ; None en cas d'échec."""
+    try:
+        r = http_get(url, params=params, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+    except StageBudgetExceeded:
+        raise   # l'étape doit échouer, pas produire une sortie partielle
+    except requests.exceptions.HTTPError as e:
+        log.warning("HTTP %s – %s", e.response.status_code, url)
+    except requests.exceptions.RequestException as e:
+        log.warning("Réseau : %s – %s", e, url)
     log.error("Abandon : %s", url)
     return None
 
 
-def write_json(path: Path, data, compact: bool = False) -> None:
+def json_bytes(data, compact: bool = False) -> bytes:
+    """
+    Sérialisation déterministe : clés triées, floats au format repr (le plus
+    court qui relit la même valeur), UTF-8 sans échappement.
+    """
+    if compact:
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    else:
+        text = json.dumps(data, ensure_ascii=False, indent=2, sort_keys=True)
+    return text.encode("utf-8")
+
+
+def _output_key(path: Path) -> str:
+    try:
+        return path.relative_to(DATA_DIR).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def _load_output_manifest() -> dict:
+    global _output_manifest
+    if _output_manifest is None:
+        try:
+            with open(OUTPUT_MANIFEST, encoding="utf-8") as f:
+                _output_manifest = json.load(f)
+        except (OSError, ValueError):
+            _output_manifest = {}
+    return _output_manifest
+
+
+def save_output_manifest() -> None:
+    """Enregistre le manifeste des empreintes et résume les écritures du passage."""
+    with _output_lock:
+        if _output_manifest is None:
+            return
+        payload = json_bytes(_output_manifest, compact=False)
+        if not OUTPUT_MANIFEST.exists() or OUTPUT_MANIFEST.read_bytes() != payload:
+            OUTPUT_MANIFEST.write_bytes(payload)
+        log.info("Fichiers : %d modifiés, %d inchangés (non réécrits)",
+                 OUTPUT_STATS["written"], OUTPUT_STATS["unchanged"])
+        OUTPUT_STATS.update(written=0, unchanged=0)
+
+
+# ---------------------------------------------------------------------------
+# Pré-compression (.gz / .br à côté de chaque fichier généré)
+# ---------------------------------------------------------------------------
+# Activée par --compress. Compression maximale (gzip -9, brotli q11) sur un
+# pool de threads (zlib et brotli relâchent le GIL) : la génération n'attend
+# pas la compression, sauf pour l'index dont le budget porte sur la taille
+# transférée.
+
+COMPRESSION = {"enabled": False, "workers": os.cpu_count() or 2}
+_compress_pool: Optional[ThreadPoolExecutor] = None
+_compress_jobs: dict[str, Future] = {}
+_compress_lock = threading.Lock()
+
+
+def _write_bytes_if_changed(path: Path, payload: bytes) -> None:
+    if path.exists() and path.stat().st_size == len(payload) and path.read_bytes() == payload:
+        return
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(payload)
+    os.replace(tmp, path)
+
+
+def _compress_artifact(path: Path, payload: bytes) -> dict[str, int]:
+    import gzip
+
+    sizes = {"raw": len(payload)}
+    gz = gzip.compress(payload, compresslevel=9, mtime=0)   # mtime=0 → octets reproductibles
+    _write_bytes_if_changed(path.with_name(path.name + ".gz"), gz)
+    sizes["gz"] = len(gz)
+    if brotli is not None:
+        br = brotli.compress(payload, quality=11)
+        _write_bytes_if_changed(path.with_name(path.name + ".br"), br)
+        sizes["br"] = len(br)
+    log.info("Compressé : %s (%.1f Ko → gz %.1f Ko%s)", path, len(payload) / 1024, sizes["gz"] / 1024,
+             f", br {sizes['br'] / 1024:.1f} Ko" if "br" in sizes else "")
+    return sizes
+
+
+def schedule_compression(path: Path, payload: bytes) -> None:
+    """Planifie l'écriture des siblings .gz/.br de `path` sur le pool de compression."""
+    global _compress_pool
+    with _compress_lock:
+        if _compress_pool is None:
+            if brotli is None:
+                log.warning("Module brotli absent : seuls les fichiers .gz sont générés")
+            _compress_pool = ThreadPoolExecutor(max_workers=COMPRESSION["workers"],
+                                                thread_name_prefix="compress")
+        _compress_jobs[_output_key(path)] = _compress_pool.submit(_compress_artifact, path, payload)
+
+
+def _siblings_present(path: Path) -> bool:
+    suffixes = [".gz"] + ([".br"] if brotli is not None else [])
+    return all(path.with_name(path.name + sfx).exists() for sfx in suffixes)
+
+
+def drop_siblings(path: Path) -> None:
+    """Supprime les .gz/.br de `path` : réécrit sans compression, ils seraient périmés."""
+    for sfx in (".gz", ".br"):
+        path.with_name(path.name + sfx).unlink(missing_ok=True)
+
+
+def transfer_size(path: Path) -> int:
+    """Plus petite taille servie pour `path` (sibling compressé le plus léger, sinon brut)."""
+    with _compress_lock:
+        job = _compress_jobs.get(_output_key(path))
+    if job is not None:
+        return min(job.result().values())
+    sizes = [path.stat().st_size]
+    for sfx in (".gz", ".br"):
+        sibling = path.with_name(path.name + sfx)
+        if sibling.exists():
+            sizes.append(sibling.stat().st_size)
+    return min(sizes)
+
+
+def wait_compression() -> None:
+    """Attend la fin des compressions planifiées et résume les gains."""
+    with _compress_lock:
+        jobs = dict(_compress_jobs)
+        _compress_jobs.clear()
+    if not jobs:
+        return
+    raw = gz = br = 0
+    for key, job in jobs.items():
+        try:
+            sizes = job.result()
+        except Exception as e:
+            log.warning("Compression en échec : %s", e)
+            with _output_lock:
+                (_output_manifest or {}).get(key, {}).pop("siblings", None)
+            continue
+        raw += sizes["raw"]
+        gz  += sizes["gz"]
+        br  += sizes.get("br", 0)
+    log.info("Compression : %d fichiers, %.1f Mo → gz %.1f Mo%s", len(jobs), raw / 1048576, gz / 1048576,
+             f", br {br / 1048576:.1f} Mo" if br else "")
+
+
+# ---------------------------------------------------------------------------
+# Noms immuables (content-addressed) + manifest.json
+# ---------------------------------------------------------------------------
+# Activé par --hashed. Chaque artefact est aussi écrit sous un nom suffixé par
+# son empreinte (index.3fa2b1c4d5e6.json) : servi `immutable` avec un an de
+# max-age (vercel.json). data/manifest.json, seul fichier à durée de vie courte,
+# associe nom logique → nom haché. Les fichiers hachés qui ne figurent dans
+# aucune des HASHED["keep"] dernières générations sont supprimés.
+# Un passage sans --hashed retire du manifeste les entrées des fichiers qu'il
+# écrit sous leur nom fixe et dont le contenu a changé : le frontend, qui
+# préfère le manifeste, lirait sinon l'ancienne version hachée.
+
+HASHED = {"enabled": False, "keep": 3}
+ARTIFACT_MANIFEST = DATA_DIR / "manifest.json"
+MANIFEST_HISTORY  = DATA_DIR / "manifest.history.json"
+_HASHED_EXCLUDED  = {"meta.json", "manifest.json", "manifest.history.json", "hashes.json"}
+_HASHED_RE        = re.compile(r"\.[0-9a-f]{12}\.(?:nd)?json(\.gz|\.br)?$")
+_hashed_names: dict[str, str] = {}
+_plain_names:  dict[str, str] = {}   # sans --hashed : nom haché qu'aurait le contenu écrit
+
+
+def hashed_name(key: str, digest: str) -> str:
+    """'details/01.json' + empreinte → 'details/01.<12 hex>.json'."""
+    stem, _, ext = key.rpartition(".")
+    return f"{stem}.{digest[:12]}.{ext}"
+
+
+def publish_hashed(path: Path, payload: bytes, digest: str, compress: bool = True) -> None:
+    """Écrit (si absente) la copie à nom haché de `path` et l'enregistre pour le manifeste."""
+    key = _output_key(path)
+    if key in _HASHED_EXCLUDED or key == path.as_posix():
+        return
+    name   = hashed_name(key, digest)
+    if not HASHED["enabled"]:
+        with _output_lock:
+            _plain_names[key] = name
+        return
+    target = DATA_DIR / name
+    if not target.exists():
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.write_bytes(payload)
+        os.replace(tmp, target)
+        if compress and COMPRESSION["enabled"]:
+            schedule_compression(target, payload)
+    elif compress and COMPRESSION["enabled"] and not _siblings_present(target):
+        schedule_compression(target, payload)
+    with _output_lock:
+        _hashed_names[key] = name
+
+
+def save_artifact_manifest() -> None:
+    """
+    Fusionne les noms hachés du passage dans data/manifest.json (un passage
+    carburants seul ne touche que son entrée), retire les entrées périmées par
+    un passage sans --hashed, ouvre une nouvelle génération si le contenu a
+    changé, puis supprime les fichiers hachés orphelins.
+    """
+    with _output_lock:
+        produced, plain = dict(_hashed_names), dict(_plain_names)
+        _hashed_names.clear()
+        _plain_names.clear()
+    if not produced and not plain:
+        return
+    try:
+        with open(ARTIFACT_MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {"generation": 0, "files": {}}
+    files = {**manifest.get("files", {}), **produced}
+    for key, name in plain.items():
+        if files.get(key, name) != name:
+            del files[key]   # le nom fixe est plus récent que la copie hachée
+    if files == manifest.get("files", {}):
+        return
+
+    generation = manifest.get("generation", 0) + 1
+    write_json(ARTIFACT_MANIFEST, {
+        "generation":   generation,
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "files":        files,
+    }, compact=True)
+
+    try:
+        with open(MANIFEST_HISTORY, encoding="utf-8") as f:
+            history = json.load(f)
+    except (OSError, ValueError):
+        history = []
+    history = [*history, {"generation": generation, "files": sorted(files.values())}][-HASHED["keep"]:]
+    write_json(MANIFEST_HISTORY, history)
+
+    live = {name for gen in history for name in gen["files"]}
+    removed = 0
+    for p in DATA_DIR.rglob("*"):
+        rel = p.relative_to(DATA_DIR).as_posix()
+        m = _HASHED_RE.search(rel)
+        if m and rel[:len(rel) - len(m.group(1) or "")] not in live:
+            p.unlink(missing_ok=True)
+            removed += 1
+    log.info("Manifeste : génération %d, %d fichiers, %d fichiers hachés obsolètes supprimés",
+             generation, len(files), removed)
+
+
+def write_json(path: Path, data, compact: bool = False) -> bool:
+    """
+    Écrit `data` en JSON déterministe. Si le contenu est identique à la version
+    sur disque (empreinte SHA-256 du manifeste OUTPUT_MANIFEST), le fichier
+    n'est pas réécrit et son mtime est conservé. Retourne True si écrit.
+    """
+    return write_output(path, json_bytes(data, compact))
+
+
+def write_output(path: Path, payload: bytes, compress: bool = True) -> bool:
+    """
+    Écrit un artefact de data/ déjà sérialisé (voir write_json). `compress=False`
+    pour les fichiers lus par requêtes Range : pas de sibling .gz/.br.
+    L'entrée du manifeste note sous "siblings" l'empreinte du contenu dont les
+    .gz/.br ont été tirés : des siblings d'une autre version sont régénérés
+    (--compress) ; un fichier réécrit sans compression perd les siens.
+    """
+    digest  = hashlib.sha256(payload).hexdigest()
+    key     = _output_key(path)
+    compressing = compress and COMPRESSION["enabled"]
+    record  = {"sha256": digest, "size": len(payload)}
+
+    with _output_lock:
+        entry = _load_output_manifest().get(key)
+    if path.exists() and path.stat().st_size == len(payload):
+        # Pas d'entrée (1er run, manifeste absent) → comparer au fichier lui-même
+        known = entry["sha256"] if entry else hashlib.sha256(path.read_bytes()).hexdigest()
+        if known == digest:
+            fresh = bool(entry) and entry.get("siblings") == digest and _siblings_present(path)
+            if compressing or fresh:
+                record["siblings"] = digest
+            with _output_lock:
+                _output_manifest[key] = record
+                OUTPUT_STATS["unchanged"] += 1
+            log.debug("Inchangé : %s", path)
+            if compressing and not fresh:
+                schedule_compression(path, payload)
+            publish_hashed(path, payload, digest, compress)
+            return False
+
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        if compact:
-            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
-        else:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    log.info("Écrit : %s (%.1f Ko)", path, path.stat().st_size / 1024)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(payload)
+    os.replace(tmp, path)
+    if compressing:
+        record["siblings"] = digest
+    with _output_lock:
+        _output_manifest[key] = record
+        OUTPUT_STATS["written"] += 1
+    log.info("Écrit : %s (%.1f Ko)", path, len(payload) / 1024)
+    if compressing:
+        schedule_compression(path, payload)
+    else:
+        drop_siblings(path)
+    publish_hashed(path, payload, digest, compress)
+    return True
 
 
 def insee_str(code) -> str:
@@ -161,11 +1378,109 @@ def compute_vivrescore(
     return round(sum(pts) / max_pts * 100)
 
 
+# ---------------------------------------------------------------------------
+# VivreScore par lots
+# ---------------------------------------------------------------------------
+# Mêmes règles que compute_vivrescore(), seuils sous forme de données : par
+# dimension, sens de comparaison et seuils des paliers 16/12/8/4 pts (du
+# meilleur au moins bon). Chaque dimension est une colonne array('d'), NaN =
+# dimension absente ; le score de toutes les communes est calculé colonne par
+# colonne. compute_vivrescore() reste la référence (tests/test_vivrescore.py).
+VIVRESCORE_POINTS = (20, 16, 12, 8, 4)
+VIVRESCORE_DIMENSIONS = {
+    "fibre":    (">=", (95, 80, 60, 40)),
+    "crime":    ("<=", (5, 15, 25, 40)),
+    "air":      ("<=", (1, 2, 3, 4)),
+    "revenu":   (">=", (30000, 25000, 20000, 15000)),
+    "pauvrete": ("<=", (10, 15, 25, 35)),
+}
+# Dimension présente mais indicateur absent → valeur retenue
+VIVRESCORE_ABSENT = {"crime": 0, "air": 6}
+_NAN = float("nan")
+
+
+def vivrescore_inputs(
+    fibre_pct: Optional[float],
+    crime_d:   Optional[dict],
+    air_d:     Optional[dict],
+    socio_d:   Optional[dict],
+) -> dict[str, Optional[float]]:
+    """Valeurs des cinq dimensions d'une commune (None = dimension absente)."""
+    def present(d: Optional[dict], key: str, dim: str) -> Optional[float]:
+        if not d:
+            return None
+        value = d.get(key)
+        return VIVRESCORE_ABSENT[dim] if value is None else value
+
+    return {
+        "fibre":    fibre_pct,
+        "crime":    present(crime_d, "taux_pour_mille", "crime"),
+        "air":      present(air_d, "iqa_moyen", "air"),
+        "revenu":   socio_d.get("revenu_median") if socio_d else None,
+        "pauvrete": socio_d.get("taux_pauvrete") if socio_d else None,
+    }
+
+
+def vivrescore_columns(inputs: list[dict[str, Optional[float]]]) -> dict[str, array]:
+    return {
+        dim: array("d", (_NAN if row[dim] is None else row[dim] for row in inputs))
+        for dim in VIVRESCORE_DIMENSIONS
+    }
+
+
+def compute_vivrescores(columns: dict[str, array]) -> list[Optional[int]]:
+    """VivreScore de chaque ligne des colonnes (None si aucune dimension)."""
+    n      = len(next(iter(columns.values())))
+    total  = [0] * n
+    nb_dim = [0] * n
+    points = VIVRESCORE_POINTS[::-1]   # nombre de seuils atteints → points
+    for dim, (sens, seuils) in VIVRESCORE_DIMENSIONS.items():
+        asc = sorted(seuils)
+        for i, v in enumerate(columns[dim]):
+            if v != v:   # NaN
+                continue
+            atteints = bisect_right(asc, v) if sens == ">=" else len(asc) - bisect_left(asc, v)
+            total[i]  += points[atteints]
+            nb_dim[i] += 1
+    best = VIVRESCORE_POINTS[0]
+    return [round(t / (best * k) * 100) if k else None for t, k in zip(total, nb_dim)]
+
+
+def percentile_ranks(values: list[Optional[int]], groups: Optional[list[str]] = None) -> list[Optional[int]]:
+    """
+    Rang centile 0-100 de chaque valeur non nulle au sein de son groupe
+    (`groups[i]`, national si None) ; les ex aequo reçoivent le rang moyen.
+    """
+    by_group: dict[Optional[str], list[int]] = {}
+    for i, v in enumerate(values):
+        if v is not None:
+            by_group.setdefault(groups[i] if groups else None, []).append(v)
+    for vs in by_group.values():
+        vs.sort()
+
+    ranks: list[Optional[int]] = []
+    for i, v in enumerate(values):
+        if v is None:
+            ranks.append(None)
+            continue
+        vs = by_group[groups[i] if groups else None]
+        below, upto = bisect_left(vs, v), bisect_right(vs, v)
+        ranks.append(round((below + (upto - below) / 2) / len(vs) * 100))
+    return ranks
+
+
 # ---------------------------------------------------------------------------
 # Étape 1 – Communes (API Géo)
 # ---------------------------------------------------------------------------
 
-def fetch_all_communes() -> list[dict]:
+def fetch_all_communes(concurrency: Optional[int] = None) -> list[dict]:
+    """
+    Récupère les communes de tous les départements.
+    Les départements sont interrogés en parallèle (concurrence et débit bornés
+    par HOST_LIMITS["geo.api.gouv.fr"]) ; l'ordre du résultat reste celui de
+    la liste des départements, identique à un parcours séquentiel.
+    concurrency=1 → parcours séquentiel.
+    """
     log.info("=== ÉTAPE 1 : Communes (API Géo) ===")
 
     deps_data = safe_get(f"{GEO_API}/departements", params={"fields": "code,nom", "limit": 200})
@@ -173,10 +1488,11 @@ def fetch_all_communes() -> list[dict]:
         log.error("Impossible de récupérer les départements.")
         sys.exit(1)
 
-    all_communes: list[dict] = []
-    total = len(deps_data)
+    total   = len(deps_data)
+    workers = concurrency or host_concurrency(GEO_API)
 
-    for i, dep in enumerate(deps_data, 1):
+    def fetch_dep(item: tuple[int, dict]) -> list[dict]:
+        i, dep = item
         code_dep = dep["code"]
         log.info("[%d/%d] Département %s", i, total, code_dep)
 
@@ -191,12 +1507,20 @@ def fetch_all_communes() -> list[dict]:
         )
         if not data:
             log.warning("Aucune donnée pour %s", code_dep)
-            continue
+            return []
 
         for c in data:
             c["codeDepartement"] = code_dep
-        all_communes.extend(data)
-        time.sleep(0.05)
+        return data
+
+    items = list(enumerate(deps_data, 1))
+    if workers <= 1:
+        results = list(map(fetch_dep, items))
+    else:
+        with StagePool(max_workers=workers, thread_name_prefix="geo") as pool:
+            results = list(pool.map(fetch_dep, items))   # map() conserve l'ordre des départements
+
+    all_communes: list[dict] = [c for data in results for c in data]
 
     log.info("Total : %d communes", len(all_communes))
     return all_communes
@@ -206,6 +1530,51 @@ def fetch_all_communes() -> list[dict]:
 # Étape 2 – DVF / immobilier
 # ---------------------------------------------------------------------------
 
+DVF_PAGE_SIZE = 500
+
+
+def _dvf_rows(data: dict) -> list[list]:
+    """Extrait [code_insee, prix_m2, nb_transactions] d'une page de résultats DV3F."""
+    rows = []
+    for item in data.get("results") or []:
+        # Le champ commune s'appelle "code" dans la nouvelle API
+        raw_code = item.get("code") or item.get("code_commune") or item.get("codgeo", "")
+        code = insee_str(raw_code) if raw_code else ""
+        pxm2 = item.get("pxm2_median_cod111")   # Prix médian m² – appartements
+        if code and pxm2 is not None:
+            rows.append([code, round(float(pxm2), 0), item.get("nbtrans_cod111")])
+    return rows
+
+
+def _load_dvf_cursor(annee: int) -> dict[int, list]:
+    """
+    Relit le curseur de pagination DVF (JSONL : 1 ligne d'en-tête puis 1 ligne
+    par page terminée). Retourne {page: rows} si le curseur correspond à
+    `annee`/DVF_PAGE_SIZE, sinon {} (le curseur obsolète est supprimé).
+    """
+    pages: dict[int, list] = {}
+    if not DVF_CURSOR_FILE.exists():
+        return pages
+    with open(DVF_CURSOR_FILE, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    try:
+        header = json.loads(lines[0]) if lines else {}
+    except ValueError:
+        header = {}
+    if header.get("annee") != annee or header.get("page_size") != DVF_PAGE_SIZE:
+        DVF_CURSOR_FILE.unlink()
+        return pages
+    for line in lines[1:]:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue   # dernière ligne tronquée par une interruption
+        if not isinstance(entry, dict) or "page" not in entry or "rows" not in entry:
+            continue   # ligne étrangère (en-tête dupliqué…)
+        pages[entry["page"]] = entry["rows"]
+    return pages
+
+
 def fetch_dvf_stats() -> dict[str, dict]:
     """
     Récupère les indicateurs DV3F par commune depuis la nouvelle API CEREMA.
@@ -215,18 +1584,29 @@ def fetch_dvf_stats() -> dict[str, dict]:
     Champ commune               : item["code"]   (pas code_commune)
     Champ prix/m²               : item["pxm2_median_cod111"]  (appartements)
     Champ nb transactions       : item["nbtrans_cod111"]
+
+    Les années candidates sont sondées en parallèle. La 1re page donne le
+    total `count` : les pages restantes sont ensuite téléchargées en parallèle
+    (concurrence bornée par HOST_LIMITS). Chaque page terminée est ajoutée au
+    curseur DVF_CURSOR_FILE : un run interrompu reprend là où il s'était arrêté.
     """
     log.info("=== ÉTAPE 2 : DVF / immobilier ===")
     dvf: dict[str, dict] = {}
+    complete = False
 
     try:
         current_year = datetime.now().year
-        # Sonde : DV3F 2025-1 inclut 2024 ; on essaie 2024 puis 2023 puis 2025
-        annee = None
-        for try_year in [current_year - 2, current_year - 3, current_year - 1]:
-            probe = safe_get(DVF_API, params={"echelle": "communes", "annee": try_year, "page_size": 1}, timeout=30)
+        # Sonde : DV3F 2025-1 inclut 2024 ; préférence 2024 puis 2023 puis 2025
+        candidates = [current_year - 2, current_year - 3, current_year - 1]
+        with StagePool(max_workers=len(candidates), thread_name_prefix="dvf-probe") as pool:
+            probes = list(pool.map(
+                lambda y: safe_get(DVF_API, params={"echelle": "communes", "annee": y, "page_size": 1}, timeout=30),
+                candidates,
+            ))
+        annee, announced = None, None
+        for try_year, probe in zip(candidates, probes):
             if probe and probe.get("results"):
-                annee = try_year
+                annee, announced = try_year, probe.get("count")
                 log.info("DVF : données disponibles pour l'année %d", annee)
                 break
             log.info("DVF : aucune donnée pour %d, essai suivant…", try_year)
@@ -234,37 +1614,89 @@ def fetch_dvf_stats() -> dict[str, dict]:
             log.warning("DVF : aucune année disponible, abandon.")
             return dvf
 
-        params = {"echelle": "communes", "annee": annee, "page_size": 500, "page": 1}
-        page = 1
-
-        while True:
-            params["page"] = page
-            data = safe_get(DVF_API, params=params, timeout=60)
-            if not data or "results" not in data or not data["results"]:
-                break
-
-            for item in data["results"]:
-                # Le champ commune s'appelle "code" dans la nouvelle API
-                raw_code = item.get("code") or item.get("code_commune") or item.get("codgeo", "")
-                code = insee_str(raw_code) if raw_code else ""
-                pxm2 = item.get("pxm2_median_cod111")   # Prix médian m² – appartements
-                if code and pxm2 is not None:
-                    dvf[code] = {
-                        "prix_m2_median":  round(float(pxm2), 0),
-                        "loyer_median":    None,
-                        "nb_transactions": item.get("nbtrans_cod111"),
-                        "annee_dvf":       annee,
-                    }
-
-            log.info("  DVF page %d → %d communes", page, len(dvf))
-            if not data.get("next"):
-                break
-            page += 1
-            time.sleep(0.15)
+        # Millésime + nombre de communes annoncé : la sonde JSON n'expose ni
+        # ETag ni date de publication, et une republication corrigée garde
+        # souvent le même effectif → réutilisation limitée au TTL de la source
+        cached = reuse_checkpoint("dvf", f"{annee}:{announced}" if announced else None,
+                                  max_age=SOURCE_TTL["dvf"])
+        if cached is not None:
+            return cached
+
+        def get_page(page: int) -> Optional[dict]:
+            params = {"echelle": "communes", "annee": annee, "page_size": DVF_PAGE_SIZE, "page": page}
+            return safe_get(DVF_API, params=params, timeout=60)
+
+        pages = _load_dvf_cursor(annee)
+        if pages:
+            log.info("DVF : reprise du curseur (%d pages déjà téléchargées)", len(pages))
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cursor_lock = threading.Lock()
+        # En-tête seulement pour un curseur neuf (un curseur conservé a déjà le sien)
+        new_cursor = not DVF_CURSOR_FILE.exists() or DVF_CURSOR_FILE.stat().st_size == 0
+        cursor = open(DVF_CURSOR_FILE, "a", encoding="utf-8")
+        if new_cursor:
+            cursor.write(json.dumps({"annee": annee, "page_size": DVF_PAGE_SIZE}) + "\n")
+
+        def record(page: int, data: Optional[dict]) -> bool:
+            if not data or not data.get("results"):
+                return False
+            rows = _dvf_rows(data)
+            with cursor_lock:
+                pages[page] = rows
+                cursor.write(json.dumps({"page": page, "rows": rows}, ensure_ascii=False) + "\n")
+                cursor.flush()
+            log.info("  DVF page %d → %d communes", page, len(rows))
+            return True
+
+        with cursor:
+            if 1 in pages:
+                # Page 1 déjà au curseur : le total annoncé par la sonde suffit
+                first, count = None, announced
+            else:
+                first = get_page(1)
+                count = first.get("count") if first else None
+                record(1, first)
+
+            if isinstance(count, int) and count > 0:
+                nb_pages = -(-count // DVF_PAGE_SIZE)
+                todo = [p for p in range(2, nb_pages + 1) if p not in pages]
+                log.info("DVF : %d communes, %d pages (%d restantes)", count, nb_pages, len(todo))
+                with StagePool(max_workers=host_concurrency(DVF_API),
+                               thread_name_prefix="dvf") as pool:
+                    for page, ok in zip(todo, pool.map(lambda p: record(p, get_page(p)), todo)):
+                        if not ok:
+                            log.warning("DVF : page %d manquante (reprise au prochain run)", page)
+                complete = all(p in pages for p in range(1, nb_pages + 1))
+            else:
+                # Pas de total annoncé → pagination séquentielle via `next`
+                page, data = 1, first if first is not None else get_page(1)
+                while data and data.get("next"):
+                    page += 1
+                    data = get_page(page)
+                    if not record(page, data):
+                        break
+                complete = data is not None and not data.get("next")
+
+        for page in sorted(pages):
+            for code, pxm2, nbtrans in pages[page]:
+                dvf[code] = {
+                    "prix_m2_median":  pxm2,
+                    "loyer_median":    None,
+                    "nb_transactions": nbtrans,
+                    "annee_dvf":       annee,
+                }
+        if complete:
+            DVF_CURSOR_FILE.unlink(missing_ok=True)
 
+    except StageBudgetExceeded:
+        raise
     except Exception as e:
         log.warning("DVF indisponible : %s", e)
 
+    if not complete:
+        # Sortie partielle : checkpointée sans version, pour que le prochain
+        # run ne la prenne pas pour la source complète et reprenne le curseur
+        _source_versions.pop("dvf", None)
     log.info("DVF : %d communes avec données immo", len(dvf))
     return dvf
 
@@ -295,52 +1727,90 @@ FILOSOFI_URL = (
 
 # ATMO France GeoServer – IQA commune (WFS CSV)
 ATMO_WFS_BASE = "https://data.atmo-france.org/geoserver/ind/ows"
+# Colonnes demandées (propertyName) et taille des pages (startIndex/count)
+ATMO_PROPERTIES = ("code_zone", "code_qual", "type_zone")
+ATMO_PAGE_SIZE  = 100_000
+# Ordre total (un indice par commune et par jour) : sans tri, startIndex/count
+# ne garantit pas des pages disjointes d'une requête à l'autre
+ATMO_SORT_BY    = "code_zone ASC,date_ech ASC"
+# Délai après lequel les indices d'un mois sont considérés définitifs : la
+# fenêtre lue (et la version du checkpoint) s'arrête au dernier mois complet
+ATMO_SETTLE_DAYS = 3
+
+
+def _dbf_float(raw: bytes) -> float:
+    try:
+        return float(raw)   # float() accepte les bytes et ignore les espaces
+    except ValueError:
+        return 0.0
 
 
-def _read_dbf(data: bytes) -> list[dict]:
-    """Lecteur DBF minimaliste (struct), sans dépendance externe.
-    Supporte les champs de type C (char) et N/F (numérique)."""
-    import io, struct
-
-    buf = io.BytesIO(data)
-    header = buf.read(32)
-    if len(header) < 32:
-        return []
+def _dbf_str(raw: bytes) -> str:
+    return raw.decode("latin-1").strip()
 
-    num_records  = struct.unpack_from("<I", header, 4)[0]
-    header_size  = struct.unpack_from("<H", header, 8)[0]
-    record_size  = struct.unpack_from("<H", header, 10)[0]
 
-    fields: list[tuple[str, str, int]] = []
-    while True:
-        fd = buf.read(32)
-        if not fd or fd[0] == 0x0D or len(fd) < 32:
+def _iter_dbf(f, columns: list[str], header_out: Optional[list] = None) -> Iterator[tuple]:
+    """
+    Lecteur DBF en flux (struct), sans dépendance externe.
+    Lit `f` (flux binaire, ex. membre de ZIP ouvert par z.open) séquentiellement
+    et ne décode que les colonnes `columns` : leurs positions sont calculées une
+    fois depuis l'en-tête, puis chaque bloc d'enregistrements est découpé par un
+    struct.Struct précompilé. Produit un tuple par enregistrement, dans l'ordre
+    de `columns`. Types C (char) → str, N/F (numérique) → float (0.0 si vide).
+    `header_out` (optionnel) reçoit la liste des colonnes présentes dans le fichier.
+    Lève ValueError si une colonne demandée est absente.
+    """
+    header = f.read(32)
+    if len(header) < 32:
+        return
+    num_records, header_size, record_size = struct.unpack_from("<IHH", header, 4)
+
+    # Descripteurs de champs (32 octets chacun) jusqu'au terminateur 0x0D
+    descriptors = f.read(header_size - 32)
+    fields: dict[str, tuple[int, int, str]] = {}
+    pos = 1   # octet 0 de chaque enregistrement = flag de suppression
+    for i in range(0, len(descriptors) - 31, 32):
+        fd = descriptors[i:i + 32]
+        if fd[0] == 0x0D:
             break
-        name  = fd[0:11].split(b"\x00")[0].decode("latin-1").strip()
-        ftype = chr(fd[11])
-        flen  = fd[16]
-        fields.append((name, ftype, flen))
-
-    buf.seek(header_size)
-    records = []
-    for _ in range(num_records):
-        raw = buf.read(record_size)
-        if not raw or len(raw) < record_size or raw[0] == 0x2A:   # 0x2A = supprimé
-            continue
-        rec: dict = {}
-        pos = 1   # sauter le flag de suppression
-        for name, ftype, flen in fields:
-            raw_val = raw[pos: pos + flen].decode("latin-1", errors="replace").strip()
-            if ftype in ("N", "F"):
-                try:
-                    rec[name] = float(raw_val) if raw_val else 0.0
-                except ValueError:
-                    rec[name] = 0.0
-            else:
-                rec[name] = raw_val
-            pos += flen
-        records.append(rec)
-    return records
+        name = fd[0:11].split(b"\x00")[0].decode("latin-1").strip()
+        fields[name] = (pos, fd[16], chr(fd[11]))
+        pos += fd[16]
+    if header_out is not None:
+        header_out.extend(fields)
+
+    missing = [c for c in columns if c not in fields]
+    if missing:
+        raise ValueError(f"colonnes absentes du DBF : {missing}")
+
+    # Layout struct : flag + (bourrage, champ) pour chaque colonne, triées par position
+    wanted = sorted(range(len(columns)), key=lambda i: fields[columns[i]][0])
+    fmt, cursor = ["<c"], 1
+    for i in wanted:
+        start, length, _ = fields[columns[i]]
+        fmt.append(f"{start - cursor}x{length}s")
+        cursor = start + length
+    fmt.append(f"{record_size - cursor}x")
+    layout = struct.Struct("".join(fmt))
+
+    convert = [_dbf_float if fields[c][2] in ("N", "F") else _dbf_str for c in columns]
+    # unpack() renvoie les champs dans l'ordre des positions → remise dans l'ordre demandé
+    order = [wanted.index(i) + 1 for i in range(len(columns))]
+    pairs = list(zip(order, convert))
+
+    block_records = 4096
+    remaining = num_records
+    while remaining > 0:
+        n     = min(block_records, remaining)
+        block = f.read(n * record_size)
+        n     = len(block) // record_size
+        if n == 0:
+            break
+        remaining -= n
+        for rec in layout.iter_unpack(block[:n * record_size]):
+            if rec[0] == b"*":   # 0x2A = supprimé
+                continue
+            yield tuple(conv(rec[j]) for j, conv in pairs)
 
 
 def fetch_arcep_fibre() -> dict[str, float]:
@@ -349,7 +1819,7 @@ def fetch_arcep_fibre() -> dict[str, float]:
     parse le DBF et retourne {code_insee: fibre_pct}.
     Aucune dépendance extra (struct + zipfile de la stdlib).
     """
-    import io, zipfile
+    import zipfile
 
     log.info("=== ÉTAPE 3 : Fibre ARCEP (data.gouv.fr) ===")
     fibre: dict[str, float] = {}
@@ -375,36 +1845,40 @@ def fetch_arcep_fibre() -> dict[str, float]:
             return fibre
 
         zip_url = commune_zips[0].get("url") or commune_zips[0].get("latest")
+        cached  = reuse_checkpoint("fibre", _resource_version(commune_zips[0]))
+        if cached is not None:
+            return cached
         log.info("ARCEP : téléchargement %s", zip_url)
 
-        # 3. Télécharger le ZIP (≈31 Mo)
-        resp = SESSION.get(zip_url, timeout=180, stream=False)
-        resp.raise_for_status()
-        log.info("ARCEP : ZIP reçu (%.1f Mo)", len(resp.content) / 1024 / 1024)
-
-        # 4. Extraire et parser le DBF
-        with zipfile.ZipFile(io.BytesIO(resp.content)) as z:
-            dbf_names = [n for n in z.namelist() if n.lower().endswith(".dbf")]
-            if not dbf_names:
-                log.warning("ARCEP : aucun fichier .dbf dans le ZIP")
-                return fibre
-            log.info("ARCEP : lecture %s", dbf_names[0])
-            dbf_data = z.read(dbf_names[0])
-
-        records = _read_dbf(dbf_data)
-        log.info("ARCEP : %d enregistrements DBF", len(records))
-        if records:
-            log.info("ARCEP : colonnes = %s", list(records[0].keys()))
-
-        # 5. Calculer le taux FTTH par commune
-        for rec in records:
-            code   = str(rec.get("INSEE_COM", "")).strip().zfill(5)
-            locaux = float(rec.get("Locaux", 0) or 0)
-            ftth   = float(rec.get("ftth",   0) or 0)
-            if code and locaux > 0:
-                pct = round(ftth / locaux * 100, 1)
-                fibre[code] = min(pct, 100.0)
-
+        # 3. Télécharger le ZIP (≈31 Mo) — servi par le cache si checksum inchangé
+        with open_download(zip_url, timeout=180, resource=commune_zips[0], seekable=True) as zf:
+            log.info("ARCEP : ZIP reçu (%.1f Mo)", zf.seek(0, io.SEEK_END) / 1024 / 1024)
+            zf.seek(0)
+
+            # 4. Lire le DBF en flux depuis le membre du ZIP (3 colonnes utiles)
+            with zipfile.ZipFile(zf) as z:
+                dbf_names = [n for n in z.namelist() if n.lower().endswith(".dbf")]
+                if not dbf_names:
+                    log.warning("ARCEP : aucun fichier .dbf dans le ZIP")
+                    return fibre
+                log.info("ARCEP : lecture %s", dbf_names[0])
+
+                # 5. Calculer le taux FTTH par commune
+                columns: list[str] = []
+                nb_records = 0
+                with z.open(dbf_names[0]) as dbf:
+                    for insee_com, locaux, ftth in _iter_dbf(dbf, ["INSEE_COM", "Locaux", "ftth"], columns):
+                        nb_records += 1
+                        code = insee_com.zfill(5)
+                        if code and locaux > 0:
+                            pct = round(ftth / locaux * 100, 1)
+                            fibre[code] = min(pct, 100.0)
+
+        log.info("ARCEP : %d enregistrements DBF", nb_records)
+        log.info("ARCEP : colonnes = %s", columns)
+
+    except StageBudgetExceeded:
+        raise
     except Exception as e:
         log.warning("ARCEP indisponible : %s", e)
 
@@ -421,9 +1895,229 @@ def fetch_arcep_fibre() -> dict[str, float]:
 # Étape 4 – Prix carburants
 # ---------------------------------------------------------------------------
 
-def fetch_fuel_prices() -> None:
+def _iter_fuel_stations(xml_stream) -> Iterator[dict]:
+    """
+    Parse le flux roulez-eco en flux (iterparse) : chaque <pdv> est converti
+    en station puis libéré (clear) — ni l'arbre complet ni le XML brut ne
+    sont gardés en mémoire.
+    """
+    import xml.etree.ElementTree as ET
+
+    sample_done = False
+    root = None
+    for event, elem in ET.iterparse(xml_stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        if elem.tag != "pdv":
+            continue
+
+        pdv         = elem
+        cp          = (pdv.get("cp") or "").strip()
+        ville       = (pdv.findtext("ville") or "").strip()
+        adresse     = (pdv.findtext("adresse") or "").strip()
+        nom_station = (pdv.findtext("enseignes/enseigne") or "").strip()
+        lat_r       = pdv.get("latitude")
+        lon_r       = pdv.get("longitude")
+
+        prix: dict[str, float] = {}
+        maj:  dict[str, str]   = {}
+        for price_el in pdv.findall("prix"):
+            nom    = price_el.get("nom", "")
+            valeur = price_el.get("valeur", "")
+            maj_ts = price_el.get("maj", "")
+            if nom:
+                try:
+                    price = normalize_fuel_price(valeur)
+                    prix[nom] = price if price is not None else 0
+                    if maj_ts:
+                        maj[nom] = maj_ts
+                except Exception:
+                    prix[nom] = 0
+
+        # Libère le <pdv> traité (et sa référence dans la racine)
+        pdv.clear()
+        root.clear()
+
+        if not prix or not cp:
+            continue
+
+        # Log diagnostic sur la première station
+        if not sample_done:
+            first_k, first_v = next(iter(prix.items()))
+            log.info("CARBURANTS sample – cp=%s ville=%s %s=%.4f €", cp, ville, first_k, first_v)
+            sample_done = True
+
+        try:
+            lat = round(float(lat_r) / 100000, 6) if lat_r else None
+            lon = round(float(lon_r) / 100000, 6) if lon_r else None
+        except (ValueError, TypeError):
+            lat = lon = None
+
+        yield {
+            "nom":     nom_station,
+            "cp":      cp,
+            "ville":   ville,
+            "adresse": adresse,
+            "lat":     lat,
+            "lon":     lon,
+            "prix":    prix,
+            "maj":     maj,
+        }
+
+
+def fuel_shard_key(cp: str) -> str:
+    """Préfixe de shard d'un code postal : 2 chiffres, 3 pour l'outre-mer (97x/98x)."""
+    return cp[:3] if cp[:2] in ("97", "98") else cp[:2]
+
+
+def write_fuel_shards(stations: list[dict], updated_at: str) -> int:
+    """
+    Écrit data/carburants/{préfixe}.json + data/carburants/index.json.
+
+    Chaque shard contient ses stations (même forme que carburants.json) et,
+    par carburant, les indices des stations triés par prix croissant : une
+    recherche par code postal télécharge quelques Ko et n'a rien à trier.
+    L'index indique, pour chaque shard, les codes postaux couverts ; il porte
+    seul `updated_at`, pour qu'un shard aux prix inchangés ne soit pas réécrit.
+    Retourne le nombre de shards.
+    """
+    shards: dict[str, list[dict]] = {}
+    for st in stations:
+        shards.setdefault(fuel_shard_key(st["cp"]), []).append(st)
+
+    FUEL_SHARD_DIR.mkdir(parents=True, exist_ok=True)
+    index: dict[str, dict] = {}
+    for key, group in sorted(shards.items()):
+        group.sort(key=lambda st: (st["cp"], st["ville"], st["nom"], st["adresse"]))
+        tri: dict[str, list[int]] = {}
+        for i, st in enumerate(group):
+            for carb, prix in st["prix"].items():
+                if prix:
+                    tri.setdefault(carb, []).append(i)
+        for carb, idx in tri.items():
+            idx.sort(key=lambda i: group[i]["prix"][carb])
+
+        write_json(FUEL_SHARD_DIR / f"{key}.json", {
+            "prefixe":  key,
+            "stations": group,
+            "tri":      tri,
+        }, compact=True)
+        index[key] = {
+            "fichier":     f"carburants/{key}.json",
+            "nb_stations": len(group),
+            "cp":          sorted({st["cp"] for st in group}),
+        }
+
+    # Shards disparus (préfixe sans station) : supprimés
+    for p in FUEL_SHARD_DIR.glob("*.json"):
+        if p.stem != "index" and "." not in p.stem and p.stem not in index:
+            for stale in (p, p.with_name(p.name + ".gz"), p.with_name(p.name + ".br")):
+                stale.unlink(missing_ok=True)
+
+    write_json(FUEL_SHARD_DIR / "index.json", {
+        "updated_at": updated_at,
+        "shards":     index,
+    }, compact=True)
+    return len(index)
+
+
+# Encodage compact (--fuel-compact) : colonnes plutôt qu'objets, carburants,
+# enseignes et villes codés par dictionnaire, prix en millièmes entiers, `maj`
+# en secondes avant `updated_at`. Les prix d'une station sont à plat dans
+# prix_carb / prix_val / prix_maj, `prix_n[i]` entrées pour la station i.
+FUEL_COMPACT = {"enabled": False}
+FUEL_COMPACT_VERSION = 1
+
+
+def _epoch(ts: str) -> Optional[int]:
+    """Horodatage ISO naïf (ou suffixé Z) → secondes, sans conversion de fuseau."""
+    try:
+        dt = datetime.fromisoformat(ts.rstrip("Z"))
+    except (ValueError, AttributeError):
+        return None
+    return int((dt.replace(tzinfo=None) - datetime(1970, 1, 1)).total_seconds())
+
+
+def encode_fuel_compact(stations: list[dict], updated_at: str) -> dict:
+    """Stations (forme carburants.json) → dictionnaire compact (voir decode_fuel_compact)."""
+    dicts: dict[str, dict[str, int]] = {"carburants": {}, "enseignes": {}, "villes": {}}
+
+    def code(kind: str, value: str) -> int:
+        return dicts[kind].setdefault(value, len(dicts[kind]))
+
+    base = _epoch(updated_at)
+    cols: dict[str, list] = {k: [] for k in (
+        "cp", "enseigne", "ville", "adresse", "lat", "lon",
+        "prix_n", "prix_carb", "prix_val", "prix_maj",
+    )}
+    for st in stations:
+        cols["cp"].append(st["cp"])
+        cols["enseigne"].append(code("enseignes", st["nom"]))
+        cols["ville"].append(code("villes", st["ville"]))
+        cols["adresse"].append(st["adresse"])
+        # Coordonnées du flux : entiers en 1e-5 degré
+        cols["lat"].append(round(st["lat"] * 100000) if st["lat"] is not None else None)
+        cols["lon"].append(round(st["lon"] * 100000) if st["lon"] is not None else None)
+        cols["prix_n"].append(len(st["prix"]))
+        for carb, prix in st["prix"].items():
+            ts = _epoch(st["maj"][carb]) if carb in st["maj"] else None
+            cols["prix_carb"].append(code("carburants", carb))
+            cols["prix_val"].append(round(prix * 1000))
+            cols["prix_maj"].append(base - ts if base is not None and ts is not None else None)
+
+    return {
+        "v":           FUEL_COMPACT_VERSION,
+        "updated_at":  updated_at,
+        "nb_stations": len(stations),
+        **{kind: list(table) for kind, table in dicts.items()},
+        **cols,
+    }
+
+
+def decode_fuel_compact(data: dict) -> dict:
+    """
+    Décodeur de référence : dictionnaire compact → forme carburants.json.
+    Les prix repassent en euros (millièmes ÷ 1000) et `maj` est restitué au
+    format ISO « AAAA-MM-JJTHH:MM:SS » (heure locale du flux, non convertie).
+    """
+    if data.get("v") != FUEL_COMPACT_VERSION:
+        raise ValueError(f"Version d'encodage carburants inconnue : {data.get('v')!r}")
+
+    base = _epoch(data["updated_at"])
+    carbs, enseignes, villes = data["carburants"], data["enseignes"], data["villes"]
+    stations: list[dict] = []
+    j = 0
+    for i, n in enumerate(data["prix_n"]):
+        prix: dict[str, float] = {}
+        maj:  dict[str, str]   = {}
+        for k in range(j, j + n):
+            carb = carbs[data["prix_carb"][k]]
+            prix[carb] = data["prix_val"][k] / 1000 if data["prix_val"][k] else 0
+            delta = data["prix_maj"][k]
+            if delta is not None and base is not None:
+                maj[carb] = datetime.utcfromtimestamp(base - delta).isoformat()
+        j += n
+        lat, lon = data["lat"][i], data["lon"][i]
+        stations.append({
+            "nom":     enseignes[data["enseigne"][i]],
+            "cp":      data["cp"][i],
+            "ville":   villes[data["ville"][i]],
+            "adresse": data["adresse"][i],
+            "lat":     lat / 100000 if lat is not None else None,
+            "lon":     lon / 100000 if lon is not None else None,
+            "prix":    prix,
+            "maj":     maj,
+        })
+    return {"updated_at": data["updated_at"], "nb_stations": len(stations), "stations": stations}
+
+
+def fetch_fuel_prices() -> int:
     """
     Récupère et stocke les prix carburants en euros décimaux (ex: 1.732).
+    Retourne le nombre de stations écrites (0 si le flux n'en contient
+    aucune) ; un échec de téléchargement ou de parsing est propagé.
 
     L'API peut retourner deux formats :
       - valeur="1.732"  → euros décimaux → stocker 1.732
@@ -431,93 +2125,49 @@ def fetch_fuel_prices() -> None:
 
     La fonction normalize_fuel_price() gère les deux cas automatiquement
     avec le seuil : raw > 100 → millièmes, sinon euros décimaux.
+
+    Le flux (temps réel, renouvelé toutes les 10 min) n'est pas mis en cache
+    disque. Le XML est lu en flux, mais la liste des stations (≈ 10 000
+    dicts, quelques dizaines de Mo) reste en mémoire : carburants.json, les
+    shards (groupés et triés par préfixe) et l'encodage compact ont chacun
+    besoin de l'ensemble des stations avant d'écrire.
     """
     log.info("=== ÉTAPE 4 : Carburants ===")
-    import xml.etree.ElementTree as ET
     import zipfile
-    import io
 
-    try:
-        r = SESSION.get(FUEL_API, timeout=60, headers={"Cache-Control": "no-cache"})
-        r.raise_for_status()
-        log.info("Flux carburants reçu : %.1f Ko", len(r.content) / 1024)
+    with open_download(FUEL_API, timeout=60, headers={"Cache-Control": "no-cache"},
+                       seekable=True, cache=False) as f:
+        log.info("Flux carburants reçu : %.1f Ko", f.seek(0, io.SEEK_END) / 1024)
+        f.seek(0)
 
-        # ZIP ou XML direct
-        if r.content[:2] == b"PK":
-            with zipfile.ZipFile(io.BytesIO(r.content)) as z:
+        # ZIP ou XML direct — le membre XML est lu en flux, jamais en entier
+        if f.peek(2)[:2] == b"PK":
+            with zipfile.ZipFile(f) as z:
                 xml_names = [n for n in z.namelist() if n.lower().endswith(".xml")]
                 if not xml_names:
                     raise ValueError("Aucun XML dans le ZIP")
-                xml_content = z.read(xml_names[0])
                 log.info("XML extrait : %s", xml_names[0])
+                with z.open(xml_names[0]) as xml_stream:
+                    stations = list(_iter_fuel_stations(xml_stream))
         else:
-            xml_content = r.content
-
-        root = ET.fromstring(xml_content)
-        stations: list[dict] = []
-        sample_done = False
-
-        for pdv in root.findall("pdv"):
-            cp          = (pdv.get("cp") or "").strip()
-            ville       = (pdv.findtext("ville") or "").strip()
-            adresse     = (pdv.findtext("adresse") or "").strip()
-            nom_station = (pdv.findtext("enseignes/enseigne") or "").strip()
-            lat_r       = pdv.get("latitude")
-            lon_r       = pdv.get("longitude")
-
-            prix: dict[str, float] = {}
-            maj:  dict[str, str]   = {}
-            for price_el in pdv.findall("prix"):
-                nom    = price_el.get("nom", "")
-                valeur = price_el.get("valeur", "")
-                maj_ts = price_el.get("maj", "")
-                if nom:
-                    try:
-                        price = normalize_fuel_price(valeur)
-                        prix[nom] = price if price is not None else 0
-                        if maj_ts:
-                            maj[nom] = maj_ts
-                    except Exception:
-                        prix[nom] = 0
-
-            if not prix or not cp:
-                continue
-
-            # Log diagnostic sur la première station
-            if not sample_done:
-                first_k, first_v = next(iter(prix.items()))
-                log.info("CARBURANTS sample – cp=%s ville=%s %s=%.4f €", cp, ville, first_k, first_v)
-                sample_done = True
-
-            try:
-                lat = round(float(lat_r) / 100000, 6) if lat_r else None
-                lon = round(float(lon_r) / 100000, 6) if lon_r else None
-            except (ValueError, TypeError):
-                lat = lon = None
-
-            stations.append({
-                "nom":     nom_station,
-                "cp":      cp,
-                "ville":   ville,
-                "adresse": adresse,
-                "lat":     lat,
-                "lon":     lon,
-                "prix":    prix,
-                "maj":     maj,
-            })
-
-        if not stations:
-            log.warning("Aucune station parsée.")
-        else:
-            write_json(FUEL_FILE, {
-                "updated_at":  datetime.utcnow().isoformat() + "Z",
-                "nb_stations": len(stations),
-                "stations":    stations,
-            }, compact=True)
-            log.info("Carburants : %d stations → %s", len(stations), FUEL_FILE)
-
-    except Exception as e:
-        log.error("Erreur carburants : %s", e)
+            stations = list(_iter_fuel_stations(f))
+
+    if not stations:
+        log.warning("Aucune station parsée.")
+        return 0
+
+    updated_at = datetime.utcnow().isoformat() + "Z"
+    write_json(FUEL_FILE, {
+        "updated_at":  updated_at,
+        "nb_stations": len(stations),
+        "stations":    stations,
+    }, compact=True)
+    nb_shards = write_fuel_shards(stations, updated_at)
+    if FUEL_COMPACT["enabled"]:
+        write_json(FUEL_COMPACT_FILE, encode_fuel_compact(stations, updated_at), compact=True)
+    log.info("Carburants : %d stations → %s (%d shards dans %s)",
+             len(stations), FUEL_FILE, nb_shards, FUEL_SHARD_DIR)
+    return len(stations)
 
 
 # ---------------------------------------------------------------------------
@@ -532,7 +2182,7 @@ def fetch_crime_data() -> dict[str, dict]:
     Retourne {code_insee: {"taux_pour_mille": X, "annee": Y}}.
     Communes < 2 000 hab non couvertes par cette base.
     """
-    import gzip, csv, io
+    import gzip, csv, io, itertools
 
     log.info("=== ÉTAPE 5 : Criminalité (SSMSI) ===")
     crime: dict[str, dict] = {}
@@ -571,19 +2221,11 @@ def fetch_crime_data() -> dict[str, dict]:
             log.warning("Crime : aucune ressource CSV trouvée")
             return crime
 
-        url = commune_res.get("url") or commune_res.get("latest")
+        url    = commune_res.get("url") or commune_res.get("latest")
+        cached = reuse_checkpoint("crime", _resource_version(commune_res))
+        if cached is not None:
+            return cached
         log.info("Crime : téléchargement %s", url)
-        resp = SESSION.get(url, timeout=300, stream=False)
-        resp.raise_for_status()
-        raw = resp.content
-        log.info("Crime : %.1f Mo reçu", len(raw) / 1024 / 1024)
-
-        # Décompresser GZ si nécessaire
-        if raw[:2] == b"\x1f\x8b":
-            raw = gzip.decompress(raw)
-
-        text = raw.decode("utf-8-sig", errors="replace")
-        sep  = ";" if text.count(";") > text.count(",") else ","
 
         # Nouveau format 2025 : CODGEO_2025, nombre, taux_pour_mille (pré-calculé),
         # est_diffuse ('diff'=public, 'ndiff'=secret), insee_pop
@@ -591,53 +2233,67 @@ def fetch_crime_data() -> dict[str, dict]:
         faits_by:  dict[str, float] = {}
         pop_by:    dict[str, int]   = {}
         annee_by:  dict[str, int]   = {}
+        nb_rows = 0
+
+        # Flux : morceaux HTTP (ou fichier du cache) → gzip incrémental → UTF-8
+        # incrémental → lignes CSV. Mémoire constante quelle que soit la taille.
+        with open_download(url, timeout=300, resource=commune_res) as raw:
+            stream = gzip.GzipFile(fileobj=raw) if raw.peek(2)[:2] == b"\x1f\x8b" else raw
+            text = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+
+            # Séparateur détecté sur la seule ligne d'en-tête
+            header = text.readline()
+            sep    = ";" if header.count(";") > header.count(",") else ","
+
+            for row in csv.DictReader(itertools.chain([header], text), delimiter=sep):
+                nb_rows += 1
+                code = (
+                    row.get("CODGEO_2025") or row.get("Code.commune") or
+                    row.get("CODGEO") or row.get("code_commune") or ""
+                ).strip()
+                if not code:
+                    continue
+                code = code.zfill(5)
 
-        for row in csv.DictReader(io.StringIO(text), delimiter=sep):
-            code = (
-                row.get("CODGEO_2025") or row.get("Code.commune") or
-                row.get("CODGEO") or row.get("code_commune") or ""
-            ).strip()
-            if not code:
-                continue
-            code = code.zfill(5)
-
-            try:
-                annee = int(str(row.get("annee") or row.get("Annee") or "0")[:4])
-            except (ValueError, TypeError):
-                annee = 0
+                try:
+                    annee = int(str(row.get("annee") or row.get("Annee") or "0")[:4])
+                except (ValueError, TypeError):
+                    annee = 0
 
-            prev = annee_by.get(code, 0)
-            if annee < prev:
-                continue  # ignorer les années antérieures
+                prev = annee_by.get(code, 0)
+                if annee < prev:
+                    continue  # ignorer les années antérieures
 
-            # Nouveau format : utiliser nombre + insee_pop
-            nombre_str = row.get("nombre") or row.get("faits") or row.get("valeur") or ""
-            est_diff   = (row.get("est_diffuse") or "diff").lower()
-            if est_diff == "ndiff" or nombre_str in ("NA", "na", ""):
-                continue  # données secrètes ou manquantes
+                # Nouveau format : utiliser nombre + insee_pop
+                nombre_str = row.get("nombre") or row.get("faits") or row.get("valeur") or ""
+                est_diff   = (row.get("est_diffuse") or "diff").lower()
+                if est_diff == "ndiff" or nombre_str in ("NA", "na", ""):
+                    continue  # données secrètes ou manquantes
 
-            try:
-                nombre = float(nombre_str.replace(",", "."))
-            except (ValueError, TypeError):
-                nombre = 0.0
+                try:
+                    nombre = float(nombre_str.replace(",", "."))
+                except (ValueError, TypeError):
+                    nombre = 0.0
 
-            pop_str = row.get("insee_pop") or row.get("POP") or row.get("pop") or "0"
-            try:
-                pop = int(float(pop_str.replace(",", ".") if isinstance(pop_str, str) else pop_str))
-            except (ValueError, TypeError):
-                pop = 0
-
-            if annee > prev:
-                # Année plus récente → réinitialiser l'accumulateur
-                faits_by[code] = nombre
-                annee_by[code] = annee
-                if pop > 0:
-                    pop_by[code] = pop
-            else:
-                # Même année, indicateur différent → cumuler
-                faits_by[code] = faits_by.get(code, 0.0) + nombre
-                if pop > 0:
-                    pop_by[code] = pop
+                pop_str = row.get("insee_pop") or row.get("POP") or row.get("pop") or "0"
+                try:
+                    pop = int(float(pop_str.replace(",", ".") if isinstance(pop_str, str) else pop_str))
+                except (ValueError, TypeError):
+                    pop = 0
+
+                if annee > prev:
+                    # Année plus récente → réinitialiser l'accumulateur
+                    faits_by[code] = nombre
+                    annee_by[code] = annee
+                    if pop > 0:
+                        pop_by[code] = pop
+                else:
+                    # Même année, indicateur différent → cumuler
+                    faits_by[code] = faits_by.get(code, 0.0) + nombre
+                    if pop > 0:
+                        pop_by[code] = pop
+
+        log.info("Crime : %d lignes lues", nb_rows)
 
         for code, total_faits in faits_by.items():
             pop  = pop_by.get(code, 0)
@@ -648,6 +2304,8 @@ def fetch_crime_data() -> dict[str, dict]:
                     "annee":           year,
                 }
 
+    except StageBudgetExceeded:
+        raise
     except Exception as e:
         log.warning("Crime indisponible : %s", e)
 
@@ -659,15 +2317,111 @@ def fetch_crime_data() -> dict[str, dict]:
 # Étape 6 – Qualité de l'air (ATMO France WFS)
 # ---------------------------------------------------------------------------
 
+def atmo_last_month(year: int, today: Optional[date] = None) -> int:
+    """
+    Dernier mois complet de `year` (indices publiés depuis ATMO_SETTLE_DAYS
+    jours) : 12 pour une année révolue, 0 si aucun mois n'est encore clos.
+    """
+    settled = (today or date.today()) - timedelta(days=ATMO_SETTLE_DAYS)
+    if settled.year > year:
+        return 12
+    return settled.month - 1 if settled.year == year else 0
+
+
+def atmo_wfs_params(
+    year:  int,
+    start: Optional[int] = None,
+    count: Optional[int] = None,
+    hits:  bool = False,
+) -> dict:
+    """
+    Paramètres GetFeature de ind:ind_atmo pour les indices journaliers des
+    communes de `year`, jusqu'à la fin de son dernier mois complet
+    (atmo_last_month) : une page CSV limitée à ATMO_PROPERTIES, ou le seul
+    nombre d'objets (resultType=hits, réponse XML sans données).
+    """
+    month = atmo_last_month(year)
+    until = (date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)) - timedelta(days=1)
+    params = {
+        "service":    "WFS",
+        "version":    "2.0.0",
+        "request":    "GetFeature",
+        "typeNames":  "ind:ind_atmo",
+        "CQL_FILTER": f"type_zone='commune' AND date_ech >= '{year}-01-01' AND date_ech <= '{until}'",
+    }
+    if hits:
+        params["resultType"] = "hits"
+        return params
+    params.update({
+        "outputFormat": "csv",
+        "propertyName": ",".join(ATMO_PROPERTIES),
+        "sortBy":       ATMO_SORT_BY,
+        "startIndex":   start,
+        "count":        count,
+    })
+    return params
+
+
+def _atmo_hits(year: int) -> Optional[int]:
+    """Nombre d'indices journaliers publiés pour `year` (None si la sonde échoue)."""
+    try:
+        r = http_get(ATMO_WFS_BASE, params=atmo_wfs_params(year, hits=True), timeout=30)
+    except StageBudgetExceeded:
+        raise
+    except requests.exceptions.RequestException as e:
+        log.info("Air : sonde %d en échec – %s", year, e)
+        return None
+    m = re.search(rb'numberMatched="(\d+)"', r.content[:4096]) if r.status_code == 200 else None
+    if not m:
+        log.info("Air : sonde %d sans réponse exploitable (HTTP %s)", year, r.status_code)
+        return None
+    return int(m.group(1))
+
+
+def _atmo_page(year: int, start: int) -> tuple[dict[str, int], dict[str, int], int]:
+    """
+    Lit une page du WFS en flux et l'agrège aussitôt : (somme des indices,
+    nombre de jours) par commune, et nombre de lignes lues.
+    Lève ValueError sur une réponse d'erreur WFS (XML au lieu du CSV).
+    """
+    import csv
+
+    total_by: dict[str, int] = {}
+    count_by: dict[str, int] = {}
+    nb_rows = 0
+    with open_download(ATMO_WFS_BASE, params=atmo_wfs_params(year, start, ATMO_PAGE_SIZE), timeout=120) as raw:
+        if raw.peek(64).lstrip()[:1] == b"<":
+            raise ValueError("réponse d'erreur WFS")
+        rows   = csv.reader(io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline=""))
+        header = next(rows, [])
+        i_zone, i_qual, i_type = (header.index(c) for c in ("code_zone", "code_qual", "type_zone"))
+        for row in rows:
+            nb_rows += 1
+            try:
+                if row[i_type].upper() != "COMMUNE":
+                    continue
+                code = row[i_zone].strip()
+                qual = int(row[i_qual])
+            except (IndexError, ValueError):
+                continue
+            if not code or qual <= 0:
+                continue
+            code = code.zfill(5)
+            total_by[code] = total_by.get(code, 0) + qual
+            count_by[code] = count_by.get(code, 0) + 1
+    return total_by, count_by, nb_rows
+
+
 def fetch_air_quality() -> dict[str, dict]:
     """
-    Récupère l'indice de qualité de l'air (IQA ATMO) par commune.
-    Source : GeoServer ATMO France, couche ind_atmo_{year}, type_zone=COM.
-    Essaie l'année la plus récente (année-1 → année-2 → année-3).
+    Récupère l'indice de qualité de l'air (IQA ATMO) par commune : moyenne des
+    indices journaliers de l'année la plus récente publiée (année-1 → année-3).
+    Source : GeoServer ATMO France, couche ind:ind_atmo, type_zone=commune.
+    Les années candidates sont sondées en parallèle (resultType=hits) ; celle
+    retenue est lue par pages startIndex/count concurrentes, limitées aux
+    colonnes utiles (propertyName) et agrégées en flux.
     Retourne {code_insee: {"iqa_moyen": X, "label": "...", "annee": Y}}.
     """
-    import csv, io
-
     log.info("=== ÉTAPE 6 : Qualité de l'air (ATMO France) ===")
     air: dict[str, dict] = {}
 
@@ -678,68 +2432,59 @@ def fetch_air_quality() -> dict[str, dict]:
     }
 
     current_year = datetime.now().year
+    years = list(range(current_year - 1, current_year - 4, -1))
+    with StagePool(max_workers=len(years), thread_name_prefix="air-probe") as pool:
+        matched = dict(zip(years, pool.map(_atmo_hits, years)))
+    year = next((y for y in years if matched[y]), None)
+    if year is None:
+        log.warning("Air : aucune donnée disponible (ATMO France WFS inaccessible ?)")
+        return air
 
-    for year in range(current_year - 1, current_year - 4, -1):
-        date_str = f"{year}-12-31"
-        params = {
-            "service":      "WFS",
-            "version":      "2.0.0",
-            "request":      "GetFeature",
-            "TypeNames":    "ind:ind_atmo",
-            "outputformat": "csv",
-            "CQL_FILTER":   f"type_zone='commune' AND date_ech='{date_str}'",
-        }
-        try:
-            resp = SESSION.get(ATMO_WFS_BASE, params=params, timeout=120)
-            if resp.status_code != 200 or len(resp.content) < 1000:
-                log.info("Air : ind:ind_atmo %d non disponible, essai suivant…", year)
-                continue
+    # Millésime + dernier mois complet : la version ne change qu'à la clôture
+    # d'un mois (une fois l'an pour une année révolue), pas à chaque indice publié
+    cached = reuse_checkpoint("air", f"{year}-{atmo_last_month(year):02d}")
+    if cached is not None:
+        return cached
 
-            text = resp.content.decode("utf-8-sig", errors="replace")
-            # Détecter une réponse d'erreur XML
-            if "<ExceptionReport" in text[:500] or "ServiceException" in text[:500]:
-                log.info("Air : ind:ind_atmo %d erreur WFS, essai suivant…", year)
-                continue
+    starts = range(0, matched[year], ATMO_PAGE_SIZE)
+    log.info("Air : année %d, %d indices journaliers, %d pages", year, matched[year], len(starts))
 
-            total_by: dict[str, int] = {}
-            count_by: dict[str, int] = {}
-
-            for row in csv.DictReader(io.StringIO(text)):
-                if (row.get("type_zone") or "").upper() != "COMMUNE":
-                    continue
-                code = (row.get("code_zone") or "").strip().zfill(5)
-                if not code:
-                    continue
-                try:
-                    qual = int(row.get("code_qual") or "0")
-                except (ValueError, TypeError):
-                    continue
-                if qual <= 0:
-                    continue
-                total_by[code] = total_by.get(code, 0) + qual
-                count_by[code] = count_by.get(code, 0) + 1
+    def page(start: int):
+        try:
+            return _atmo_page(year, start)
+        except StageBudgetExceeded:
+            raise
+        except Exception as e:
+            log.warning("Air : page %d en échec – %s", start // ATMO_PAGE_SIZE + 1, e)
+            return None
 
-            if not total_by:
-                log.info("Air : ind_atmo_%d – aucune donnée commune trouvée", year)
+    total_by: dict[str, int] = {}
+    count_by: dict[str, int] = {}
+    nb_rows = failed = 0
+    with StagePool(max_workers=host_concurrency(ATMO_WFS_BASE), thread_name_prefix="air") as pool:
+        for result in pool.map(page, starts):
+            if result is None:
+                failed += 1
                 continue
+            totals, counts, rows = result
+            nb_rows += rows
+            for code, total in totals.items():
+                total_by[code] = total_by.get(code, 0) + total
+                count_by[code] = count_by.get(code, 0) + counts[code]
+    if failed:
+        log.warning("Air : %d/%d pages manquantes, moyennes calculées sur les jours reçus", failed, len(starts))
+        # Moyennes partielles : checkpoint sans version, la source sera relue au prochain run
+        _source_versions.pop("air", None)
+
+    for code, total in total_by.items():
+        iqa = round(total / count_by[code], 1)
+        air[code] = {
+            "iqa_moyen": iqa,
+            "label":     _labels.get(min(round(iqa), 6), "Inconnu"),
+            "annee":     year,
+        }
 
-            for code in total_by:
-                iqa = round(total_by[code] / count_by[code], 1)
-                air[code] = {
-                    "iqa_moyen": iqa,
-                    "label":     _labels.get(min(round(iqa), 6), "Inconnu"),
-                    "annee":     year,
-                }
-
-            log.info("Air : %d communes (année %d)", len(air), year)
-            break
-
-        except Exception as e2:
-            log.info("Air : erreur %d – %s", year, e2)
-            continue
-
-    if not air:
-        log.warning("Air : aucune donnée disponible (ATMO France WFS inaccessible ?)")
+    log.info("Air : %d communes (année %d, %d lignes)", len(air), year, nb_rows)
     return air
 
 
@@ -758,8 +2503,13 @@ def fetch_filosofi() -> dict[str, dict]:
     log.info("=== ÉTAPE 7 : Filosofi INSEE (revenus / pauvreté) ===")
     socio: dict[str, dict] = {}
 
+    # Fichier millésimé : l'URL suffit à identifier la version
+    cached = reuse_checkpoint("socio", FILOSOFI_URL)
+    if cached is not None:
+        return cached
+
     try:
-        resp = SESSION.get(FILOSOFI_URL, timeout=120)
+        resp = http_get(FILOSOFI_URL, timeout=120)
         resp.raise_for_status()
         log.info("Filosofi : %.1f Mo reçu", len(resp.content) / 1024 / 1024)
 
@@ -831,6 +2581,8 @@ def fetch_filosofi() -> dict[str, dict]:
                         "annee":         2021,
                     }
 
+    except StageBudgetExceeded:
+        raise
     except Exception as e:
         log.warning("Filosofi indisponible : %s", e)
 
@@ -842,6 +2594,285 @@ def fetch_filosofi() -> dict[str, dict]:
 # Étape 8 – Index + détails
 # ---------------------------------------------------------------------------
 
+# ---------------------------------------------------------------------------
+# Table compacte des communes
+# ---------------------------------------------------------------------------
+
+class CommuneStore:
+    """
+    Communes de l'API Géo en colonnes, triées par code INSEE : une liste ou
+    un array par champ (NaN = absent) et un seul dictionnaire code INSEE →
+    ligne, au lieu d'un dict par commune. Les fiches détail sont produites à
+    la demande (detail()) puis écrites département par département.
+    """
+
+    __slots__ = (
+        "row", "code_insee", "nom", "code_dep", "code_region", "codes_postaux",
+        "population", "surface", "lat", "lon",
+    )
+
+    def __init__(self, communes: list[dict]):
+        # Ordre stable (code INSEE) quel que soit l'ordre de réponse des API
+        ordered = sorted(communes, key=lambda c: insee_str(c.get("code", "")))
+        self.code_insee    = [insee_str(c.get("code", "")) for c in ordered]   # String 5 chars
+        self.row           = {code: i for i, code in enumerate(self.code_insee)}
+        self.nom           = [c.get("nom", "") for c in ordered]
+        self.code_dep      = [sys.intern(str(c.get("codeDepartement", ""))) for c in ordered]
+        self.code_region   = [sys.intern(str(c.get("codeRegion", ""))) for c in ordered]
+        self.codes_postaux = [tuple(str(cp) for cp in c.get("codesPostaux", [])) for c in ordered]
+        self.population    = array("q", (c.get("population") or 0 for c in ordered))
+        self.surface       = array("d", (c.get("surface") or _NAN for c in ordered))
+        coords             = [((c.get("centre") or {}).get("coordinates") or [None, None]) for c in ordered]
+        self.lon           = array("d", (_NAN if x is None else x for x, _ in coords))
+        self.lat           = array("d", (_NAN if y is None else y for _, y in coords))
+
+    def __len__(self) -> int:
+        return len(self.code_insee)
+
+    def detail(self, i: int) -> dict:
+        """Champs de base de la fiche détail de la ligne `i`."""
+        surface, lat, lon = self.surface[i], self.lat[i], self.lon[i]
+        return {
+            "code_insee":    self.code_insee[i],        # String — TOUJOURS
+            "nom":           self.nom[i],
+            "codes_postaux": list(self.codes_postaux[i]),
+            "code_dep":      self.code_dep[i],
+            "code_region":   self.code_region[i],
+            "population":    self.population[i],
+            "surface_km2":   round(surface / 100, 2) if surface == surface else None,
+            "lat":           lat if lat == lat else None,
+            "lon":           lon if lon == lon else None,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Index colonnaire (data/index.cols.json)
+# ---------------------------------------------------------------------------
+# Mêmes lignes, même ordre que index.json, une colonne par champ :
+#   insee : écarts successifs entre clés numériques (2Axxx → 20000+xxx,
+#           2Bxxx → 20500+xxx ; le département 20 n'existe plus)
+#   cp    : entier = code postal moins le préfixe du département (« 74000 »
+#           pour 74081 → 0), chaîne = code postal complet sinon
+#   pop   : varints LEB128 concaténés, en base64
+INDEX_COLUMNS_VERSION = 1
+
+
+def _insee_key(code: str) -> int:
+    if code[:2] == "2A":
+        return 20000 + int(code[2:])
+    if code[:2] == "2B":
+        return 20500 + int(code[2:])
+    return int(code)
+
+
+def _dep_prefix(code: str) -> str:
+    """Préfixe postal attendu pour une commune : 20 (Corse), 97x (outre-mer), sinon 2 chiffres."""
+    if code[:2] in ("2A", "2B"):
+        return "20"
+    return code[:3] if code[:2] == "97" else code[:2]
+
+
+def _pack_varints(values: list[int]) -> str:
+    out = bytearray()
+    for v in values:
+        while v >= 0x80:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+    return base64.b64encode(bytes(out)).decode("ascii")
+
+
+def encode_index_columns(rows: list[list]) -> dict:
+    """Lignes [nom, code_insee, cp, pop, vivrescore] → colonnes (voir en-tête de section)."""
+    insee, cps = [], []
+    prev = 0
+    for _, code, cp, _, _ in rows:
+        key = _insee_key(code)
+        insee.append(key - prev)
+        prev = key
+        prefix = _dep_prefix(code)
+        rest = cp[len(prefix):]
+        cps.append(int(rest) if len(cp) == 5 and cp.startswith(prefix) and rest.isdigit() else cp)
+    return {
+        "v":          INDEX_COLUMNS_VERSION,
+        "n":          len(rows),
+        "nom":        [r[0] for r in rows],
+        "insee":      insee,
+        "cp":         cps,
+        "pop":        _pack_varints([max(0, int(r[3])) for r in rows]),
+        "vivrescore": [r[4] for r in rows],
+    }
+
+
+def decode_index_columns(data: dict) -> list[list]:
+    """Décodeur de référence : colonnes → lignes de index.json."""
+    if data.get("v") != INDEX_COLUMNS_VERSION:
+        raise ValueError(f"Version d'index colonnaire inconnue : {data.get('v')!r}")
+    raw = base64.b64decode(data["pop"])
+    pops, v, shift = [], 0, 0
+    for b in raw:
+        v |= (b & 0x7F) << shift
+        shift += 7
+        if b < 0x80:
+            pops.append(v)
+            v = shift = 0
+
+    rows, key = [], 0
+    for i in range(data["n"]):
+        key += data["insee"][i]
+        if 20000 <= key < 21000:
+            code = ("2A%03d" % (key - 20000)) if key < 20500 else ("2B%03d" % (key - 20500))
+        else:
+            code = "%05d" % key
+        cp = data["cp"][i]
+        if isinstance(cp, int):
+            prefix = _dep_prefix(code)
+            cp = prefix + str(cp).zfill(5 - len(prefix))
+        rows.append([data["nom"][i], code, cp, pops[i], data["vivrescore"][i]])
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# Index de recherche (data/search.json)
+# ---------------------------------------------------------------------------
+# Précalculé pour search.worker.js, lignes dans l'ordre de index.json :
+#   noms : noms repliés (minuscules, sans diacritiques, séparateurs → espace)
+#   mots : paires à plat [ligne, décalage] pour chaque début de mot, triées
+#          par noms[ligne][décalage:] → recherche préfixe par dichotomie
+#   cp   : lignes triées par code postal → recherche préfixe par dichotomie
+# fold_name() doit rester identique au fold() du worker.
+SEARCH_VERSION = 1
+# \s de JavaScript (celui de Python inclut aussi \x1c-\x1f et \x85, pas \ufeff)
+_JS_SPACES     = "\t\n\v\f\r \u00a0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000\ufeff"
+_SEPARATORS_RE = re.compile(f"[-{_JS_SPACES}'\u2019]+")
+
+
+def fold_name(name: str) -> str:
+    decomposed = unicodedata.normalize("NFD", name.lower())
+    stripped   = "".join(ch for ch in decomposed if not "\u0300" <= ch <= "\u036f")
+    return _SEPARATORS_RE.sub(" ", stripped).strip(" ")
+
+
+def build_search_index(rows: list[list]) -> dict:
+    noms = [fold_name(r[0]) for r in rows]
+    starts = [
+        (i, off)
+        for i, nom in enumerate(noms)
+        for off in [0] + [k + 1 for k, ch in enumerate(nom) if ch == " "]
+    ]
+    starts.sort(key=lambda p: noms[p[0]][p[1]:])
+    return {
+        "v":    SEARCH_VERSION,
+        "n":    len(rows),
+        "noms": noms,
+        "mots": [x for pair in starts for x in pair],
+        "cp":   sorted(range(len(rows)), key=lambda i: rows[i][2]),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Tri et facettes de l'explorateur (data/explorer.json)
+# ---------------------------------------------------------------------------
+# Permutations des lignes de index.json (ordre croissant) pour chaque clé de
+# tri de explorer.html, en Uint16/Uint32 little-endian base64 ; `score` ne
+# contient que les communes ayant un VivreScore. `deps` donne la plage
+# [début, fin) de chaque département : les lignes sont triées par code INSEE.
+EXPLORER_VERSION = 1
+# Ordre ICU (racine) : espaces et ponctuation < chiffres < lettres
+_COLLATION_PUNCT = " _-,;:!?.'\"()[]{}@*/\\&#%`^+<=>|~$"
+_COLLATION_MAP   = {ord(ch): chr(1 + k) for k, ch in enumerate(_COLLATION_PUNCT)}
+_LIGATURES       = {"œ": "oe", "æ": "ae", "ß": "ss"}
+_COLLATION_MAP.update({ord(ch): exp for ch, exp in _LIGATURES.items()})
+# Variantes qui ne diffèrent qu'au niveau tertiaire (comme la casse) : L'Isle < L’Isle < L'Isle-Adam
+_TERTIARY_VARIANTS = {"’": "'"}
+
+
+def french_sort_key(name: str) -> tuple:
+    """
+    Approximation stdlib de localeCompare(…, 'fr') : lettres de base d'abord
+    (accents et casse ignorés), puis ligatures et accents, puis casse.
+    """
+    # Clés en chaînes (comparées lettre à lettre comme des listes, sans leur coût
+    # mémoire) : secondaire = par lettre de base « ligature 0/1 + diacritiques +
+    # \0 » (oe < œ, e < é) ; tertiaire = casse 0/1 par lettre (minuscule d'abord)
+    secondary: list[str] = []
+    tertiary:  list[str] = []
+    base = []
+    for ch in unicodedata.normalize("NFD", name):
+        if unicodedata.combining(ch):
+            if secondary:
+                secondary[-1] = secondary[-1][:-1] + ch + "\0"
+            continue
+        variant = _TERTIARY_VARIANTS.get(ch)
+        base.append(variant or ch)
+        lig = _LIGATURES.get(ch.lower())
+        for _ in lig or ch:
+            secondary.append("1\0" if lig else "0\0")
+            tertiary.append("1" if variant or ch.isupper() else "0")
+    primary = "".join(base).lower().translate(_COLLATION_MAP)
+    return primary, "".join(secondary), "".join(tertiary)
+
+
+def dep_of(code_insee: str) -> str:
+    """Département d'un code INSEE : 3 caractères outre-mer (97x), 2 sinon."""
+    return code_insee[:3] if code_insee.startswith("97") else code_insee[:2]
+
+
+def _pack_ids(ids: list[int], width: int) -> str:
+    return base64.b64encode(struct.pack(f"<{len(ids)}{'H' if width == 2 else 'I'}", *ids)).decode("ascii")
+
+
+def build_explorer_index(rows: list[list]) -> dict:
+    n     = len(rows)
+    width = 2 if n <= 0xFFFF else 4
+    order = range(n)
+    tri = {
+        "nom":   sorted(order, key=lambda i: french_sort_key(rows[i][0])),
+        "pop":   sorted(order, key=lambda i: rows[i][3] or 0),
+        "cp":    sorted(order, key=lambda i: rows[i][2]),
+        "score": sorted((i for i in order if rows[i][4] is not None), key=lambda i: rows[i][4]),
+    }
+    deps: dict[str, list[int]] = {}
+    for i, row in enumerate(rows):
+        plage = deps.setdefault(dep_of(row[1]), [i, i])
+        plage[1] = i + 1
+    return {
+        "v":     EXPLORER_VERSION,
+        "n":     n,
+        "width": width,
+        "tri":   {key: _pack_ids(ids, width) for key, ids in tri.items()},
+        "deps":  deps,
+    }
+
+
+def write_detail_pack(dep_code: str, dep_list: list[dict]) -> bool:
+    """
+    Écrit data/details/{dep}.ndjson (une fiche JSON compacte par ligne, triées
+    par code INSEE) et data/details/{dep}.offsets.json (codes triés, début et
+    longueur en octets de chaque fiche) : une fiche = une requête
+    `Range: bytes=début-(début+longueur-1)`, la table permet une dichotomie.
+    Le pack n'est pas pré-compressé (les offsets portent sur les octets bruts).
+    Retourne True si le pack a été réécrit.
+    """
+    buf = bytearray()
+    codes, debut, longueur = [], [], []
+    for detail in sorted(dep_list, key=lambda d: d["code_insee"]):
+        line = json_bytes(detail, compact=True)
+        codes.append(detail["code_insee"])
+        debut.append(len(buf))
+        longueur.append(len(line))
+        buf += line + b"\n"
+
+    changed = write_output(DETAILS_DIR / f"{dep_code}.ndjson", bytes(buf), compress=False)
+    write_json(DETAILS_DIR / f"{dep_code}.offsets.json", {
+        "fichier":  f"details/{dep_code}.ndjson",
+        "codes":    codes,
+        "debut":    debut,
+        "longueur": longueur,
+    }, compact=True)
+    return changed
+
+
 def build_index_and_details(
     communes: list[dict],
     dvf:      dict,
@@ -849,90 +2880,111 @@ def build_index_and_details(
     crime:    dict,
     air:      dict,
     socio:    dict,
-) -> None:
+) -> int:
     """
-    Génère :
+    Génère (et retourne le nombre de communes indexées) :
     - data/index.json           : index léger pour l'autocomplete (<1.5 Mo)
+    - data/index.cols.json      : le même index en colonnes (voir encode_index_columns)
+    - data/search.json          : index de recherche préfixe du worker (voir build_search_index)
+    - data/explorer.json        : permutations de tri + plages par département (build_explorer_index)
     - data/details/{dep}.json   : fiches enrichies par département
+    - data/details/{dep}.ndjson + {dep}.offsets.json : mêmes fiches, lisibles une à une (Range)
 
     RÈGLE : code_insee TOUJOURS stocké en String ("74081", jamais 74081).
     """
     log.info("=== ÉTAPE 8 : Index + détails ===")
 
-    index_entries: list[list] = []
-    details_by_dep: dict[str, list[dict]] = {}
-
-    for c in communes:
-        code_insee    = insee_str(c.get("code", ""))   # String 5 chars
-        nom           = c.get("nom", "")
-        code_dep      = str(c.get("codeDepartement", ""))
-        codes_postaux = [str(cp) for cp in c.get("codesPostaux", [])]
-        cp_principal  = codes_postaux[0] if codes_postaux else ""
-        population    = c.get("population") or 0
-        centre        = c.get("centre") or {}
-        coords        = centre.get("coordinates", [None, None])
-        lat, lon      = coords[1], coords[0]
-
-        # Entrée détail
-        detail: dict = {
-            "code_insee":    code_insee,        # String — TOUJOURS
-            "nom":           nom,
-            "codes_postaux": codes_postaux,
-            "code_dep":      code_dep,
-            "code_region":   str(c.get("codeRegion", "")),
-            "population":    population,
-            "surface_km2":   round(c.get("surface", 0) / 100, 2) if c.get("surface") else None,
-            "lat":           lat,
-            "lon":           lon,
-        }
-
-        # DVF : lookup String → String
-        dvf_data = dvf.get(code_insee)
-        if dvf_data:
-            detail["immo"] = dvf_data
-
-        # Fibre : lookup String 5-chars → String 5-chars
-        fibre_pct = fibre.get(code_insee)
-        if fibre_pct is not None:
-            detail["fibre_pct"] = fibre_pct
-
-        # Criminalité (SSMSI)
-        crime_d = crime.get(code_insee)
-        if crime_d:
-            detail["securite"] = crime_d
-
-        # Qualité de l'air (ATMO France)
-        air_d = air.get(code_insee)
-        if air_d:
-            detail["air"] = air_d
-
-        # Socio-économique : Filosofi
-        socio_d = socio.get(code_insee)
-        if socio_d:
-            detail["socio"] = dict(socio_d)
-
-        # VivreScore — calculé après TOUTES les dimensions enrichies
-        # Entrée index léger : [nom, code_insee(str), cp(str), pop(int), vivrescore(int|null)]
-        taux_pauv_v = socio_d.get("taux_pauvrete") if socio_d else None
-        vivrescore = compute_vivrescore(fibre_pct, crime_d, air_d, socio_d, taux_pauv_v)
-        index_entries.append([nom, code_insee, cp_principal, population, vivrescore])
-        if vivrescore is not None:
-            detail["vivrescore"] = vivrescore
-
-        details_by_dep.setdefault(code_dep, []).append(detail)
+    store = CommuneStore(communes)
+    n     = len(store)
+
+    # Entrées index léger : [nom, code_insee(str), cp(str), pop(int), vivrescore(int|null)]
+    index_entries: list[list] = [
+        [store.nom[i], store.code_insee[i], store.codes_postaux[i][0] if store.codes_postaux[i] else "",
+         store.population[i], None]
+        for i in range(n)
+    ]
+
+    # VivreScore — calculé après TOUTES les dimensions enrichies, puis rangs
+    # centiles national et départemental
+    score_inputs = [
+        vivrescore_inputs(fibre.get(code), crime.get(code), air.get(code), socio.get(code))
+        for code in store.code_insee
+    ]
+    scores   = compute_vivrescores(vivrescore_columns(score_inputs))
+    rang_fr  = percentile_ranks(scores)
+    rang_dep = percentile_ranks(scores, store.code_dep)
+    for entry, score in zip(index_entries, scores):
+        entry[4] = score
+
+    del score_inputs
 
     write_json(INDEX_FILE, index_entries, compact=True)
+    write_json(INDEX_COLUMNS_FILE, encode_index_columns(index_entries), compact=True)
+    write_json(SEARCH_FILE, build_search_index(index_entries), compact=True)
+    write_json(EXPLORER_FILE, build_explorer_index(index_entries), compact=True)
+    log.info("Index colonnaire : %.2f Mo (lignes : %.2f Mo)",
+             INDEX_COLUMNS_FILE.stat().st_size / (1024 * 1024),
+             INDEX_FILE.stat().st_size / (1024 * 1024))
 
     size_mb = INDEX_FILE.stat().st_size / (1024 * 1024)
-    if size_mb > 1.5:
+    if COMPRESSION["enabled"]:
+        # Budget appliqué à la taille transférée (sibling compressé le plus léger)
+        raw_mb  = size_mb
+        size_mb = transfer_size(INDEX_FILE) / (1024 * 1024)
+        log.info("Index : %.2f Mo bruts, %.2f Mo transférés", raw_mb, size_mb)
+    if size_mb > INDEX_BUDGET_MB:
         log.warning("⚠️  Index trop lourd : %.2f Mo", size_mb)
     else:
         log.info("✅ Index OK : %.2f Mo", size_mb)
 
-    for dep_code, dep_list in details_by_dep.items():
-        write_json(DETAILS_DIR / f"{dep_code}.json", dep_list, compact=True)
+    # Fiches détail construites et écrites département par département : une
+    # seule liste de fiches en mémoire à la fois
+    rows_by_dep: dict[str, list[int]] = {}
+    for i, dep_code in enumerate(store.code_dep):
+        rows_by_dep.setdefault(dep_code, []).append(i)
+
+    changed = 0
+    for dep_code, rows in rows_by_dep.items():
+        dep_list = []
+        for i in rows:
+            code_insee = store.code_insee[i]
+            detail = store.detail(i)
+
+            # DVF : lookup String → String
+            dvf_data = dvf.get(code_insee)
+            if dvf_data:
+                detail["immo"] = dvf_data
+
+            # Fibre : lookup String 5-chars → String 5-chars
+            fibre_pct = fibre.get(code_insee)
+            if fibre_pct is not None:
+                detail["fibre_pct"] = fibre_pct
 
-    log.info("Détails : %d départements", len(details_by_dep))
+            # Criminalité (SSMSI)
+            crime_d = crime.get(code_insee)
+            if crime_d:
+                detail["securite"] = crime_d
+
+            # Qualité de l'air (ATMO France)
+            air_d = air.get(code_insee)
+            if air_d:
+                detail["air"] = air_d
+
+            # Socio-économique : Filosofi
+            socio_d = socio.get(code_insee)
+            if socio_d:
+                detail["socio"] = dict(socio_d)
+
+            if scores[i] is not None:
+                detail["vivrescore"]      = scores[i]
+                detail["vivrescore_rang"] = {"france": rang_fr[i], "departement": rang_dep[i]}
+            dep_list.append(detail)
+
+        changed += write_json(DETAILS_DIR / f"{dep_code}.json", dep_list, compact=True)
+        write_detail_pack(dep_code, dep_list)
+
+    log.info("Détails : %d départements (%d modifiés)", len(rows_by_dep), changed)
+    return n
 
 
 # ---------------------------------------------------------------------------
@@ -941,9 +2993,10 @@ def build_index_and_details(
 
 def write_meta(nb_communes: int) -> None:
     write_json(META_FILE, {
-        "last_update": datetime.utcnow().isoformat() + "Z",
-        "nb_communes": nb_communes,
-        "version":     "2.3",
+        "last_update":   datetime.utcnow().isoformat() + "Z",
+        "nb_communes":   nb_communes,
+        "version":       "2.3",
+        "stale_sources": stale_sources(),
         "sources": {
             "communes":    "https://geo.api.gouv.fr",
             "immobilier":  "https://apidf-preprod.cerema.fr",
@@ -957,33 +3010,656 @@ def write_meta(nb_communes: int) -> None:
     })
 
 
+# ---------------------------------------------------------------------------
+# Orchestration des étapes (graphe de dépendances)
+# ---------------------------------------------------------------------------
+
+class Stage(NamedTuple):
+    """
+    Étape du pipeline. `fn` reçoit en arguments positionnels les résultats
+    des étapes listées dans `inputs` (dans cet ordre).
+    `fallback` fabrique la valeur de repli en cas d'échec (comportement
+    historique : `{}`) ; None → étape bloquante, ses dépendantes sont ignorées.
+    """
+    name:     str
+    fn:       Callable
+    inputs:   tuple = ()
+    fallback: Optional[Callable] = dict
+
+
+def run_stages(stages: list[Stage], workers: int, keep: frozenset = frozenset()) -> tuple[dict, dict]:
+    """
+    Exécute les étapes sur un pool de `workers` threads dès que leurs entrées
+    sont disponibles. Les échecs restent isolés par étape.
+    Le résultat d'une étape est libéré (None) dès que toutes les étapes qui
+    le consomment sont terminées, sauf pour les étapes listées dans `keep`.
+    Chaque étape est mesurée (instrument_stage) ; voir write_run_metrics().
+    Ses requêtes HTTP sont bornées par son budget de temps (stage_budget).
+    Retourne (résultats par étape, chronologie {nom: (début, fin, statut)}).
+    """
+    by_name = {st.name: st for st in stages}
+    for st in stages:
+        missing = [d for d in st.inputs if d not in by_name]
+        if missing:
+            raise ValueError(f"Étape {st.name} : entrées inconnues {missing}")
+
+    results:  dict[str, object] = {}
+    status:   dict[str, str]    = {}
+    timeline: dict[str, tuple]  = {}
+    consumers = {st.name: sum(st.name in other.inputs for other in stages) for st in stages}
+    t0 = time.monotonic()
+
+    def release(st: Stage) -> None:
+        for d in st.inputs:
+            consumers[d] -= 1
+            if not consumers[d] and d not in keep:
+                results[d] = None
+
+    def run(st: Stage):
+        begin = time.monotonic() - t0
+        with instrument_stage(st.name) as metrics, stage_budget(st.name):
+            try:
+                value, state = st.fn(*(results[d] for d in st.inputs)), "ok"
+            except (Exception, SystemExit) as e:
+                log.error("Étape %s en échec : %s", st.name, e or type(e).__name__)
+                value, state = (st.fallback() if st.fallback else None), "échec"
+            metrics["records"], metrics["status"] = _record_count(value), state
+        timeline[st.name] = (begin, time.monotonic() - t0, state)
+        return value, state
+
+    pending = list(stages)
+    running: dict = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="stage") as pool:
+        while pending or running:
+            for st in list(pending):
+                if any(d not in status for d in st.inputs):
+                    continue
+                pending.remove(st)
+                blocked = [d for d in st.inputs if status[d] == "échec" and by_name[d].fallback is None]
+                if blocked:
+                    log.error("Étape %s ignorée : dépend de %s en échec", st.name, ", ".join(blocked))
+                    status[st.name] = "échec"
+                    results[st.name] = st.fallback() if st.fallback else None
+                    timeline[st.name] = (None, None, "ignorée")
+                    release(st)
+                    continue
+                running[pool.submit(run, st)] = st
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                st = running.pop(fut)
+                results[st.name], status[st.name] = fut.result()
+                release(st)
+
+    return results, timeline
+
+
+def log_timeline(timeline: dict) -> None:
+    """Affiche la chronologie des étapes (barres proportionnelles au temps écoulé)."""
+    ends  = [end for _, end, _ in timeline.values() if end is not None]
+    total = max(ends) if ends else 0.0
+    width = 40
+    log.info("Chronologie des étapes (%.1f s) :", total)
+    for name, (begin, end, state) in sorted(
+        timeline.items(), key=lambda kv: (kv[1][0] is None, kv[1][0] or 0)
+    ):
+        if begin is None:
+            log.info("  %-9s %s", name, state)
+            continue
+        a = int(begin / total * width) if total else 0
+        b = max(a + 1, int(end / total * width)) if total else 1
+        bar = " " * a + "█" * (b - a) + " " * (width - b)
+        log.info("  %-9s |%s| %6.1f → %6.1f s (%5.1f s) %s",
+                 name, bar, begin, end, end - begin, state)
+
+
+# ---------------------------------------------------------------------------
+# Planification : TTL par source + checkpoints d'étapes
+# ---------------------------------------------------------------------------
+# Chaque source a sa propre durée de validité. La sortie parsée de chaque
+# étape est checkpointée dans STAGE_DIR avec la version de sa source
+# (checksum data.gouv.fr, millésime…) et l'identifiant du run :
+#   - une source encore « fraîche » est relue au lieu d'être retéléchargée ;
+#   - une source dont la version n'a pas changé n'est ni téléchargée ni reparsée ;
+#   - un run interrompu (échec de l'étape 8…) reprend sans refaire les
+#     sources déjà checkpointées.
+# Un rafraîchissement limité aux carburants ne relance ni l'étape 8 ni les
+# autres sources.
+
+SOURCE_TTL: dict[str, int] = {
+    "communes": 7 * 86400,
+    "dvf":      7 * 86400,
+    "fibre":    7 * 86400,
+    "fuel":     10 * 60,
+    "crime":    30 * 86400,
+    "air":      30 * 86400,
+    "socio":    7 * 86400,
+}
+
+SOURCE_FETCHERS: dict[str, Callable] = {
+    "communes": fetch_all_communes,
+    "dvf":      fetch_dvf_stats,
+    "fibre":    fetch_arcep_fibre,
+    "fuel":     fetch_fuel_prices,
+    "crime":    fetch_crime_data,
+    "air":      fetch_air_quality,
+    "socio":    fetch_filosofi,
+}
+
+STAGE_ORDER  = [*SOURCE_FETCHERS, "build", "meta"]
+BUILD_INPUTS = ("communes", "dvf", "fibre", "crime", "air", "socio")
+
+# Délai avant de retenter une source en échec (sinon elle serait « due » à chaque passage)
+FAILED_SOURCE_RETRY = 3600
+
+# Checkpoints d'étapes (--fresh → ignorés : ni reprise ni réutilisation)
+CHECKPOINTS = {"enabled": True}
+
+_schedule_lock   = threading.Lock()
+_run_state       = {"run_id": None}
+_source_versions: dict[str, str] = {}
+_reused:          set[str]       = set()
+
+
+def parse_duration(text: str) -> int:
+    """'90' → 90 s, '10m' → 600, '6h' → 21600, '7d' → 604800."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    text  = text.strip().lower()
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+
+def _stage_path(name: str) -> Path:
+    return STAGE_DIR / f"{name}.json.gz"
+
+
+def _stage_meta_path(name: str) -> Path:
+    return STAGE_DIR / f"{name}.meta.json"
+
+
+def stage_meta(name: str) -> dict:
+    """Métadonnées du checkpoint de `name` : version de source, run_id, saved_at."""
+    try:
+        with open(_stage_meta_path(name), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def has_stage_output(name: str) -> bool:
+    """True si un checkpoint réutilisable existe (toujours False avec --fresh)."""
+    return CHECKPOINTS["enabled"] and _stage_path(name).exists()
+
+
+def save_stage_output(name: str, value, version: Optional[str] = None) -> None:
+    """Checkpoint de la sortie d'une étape : JSON compact gzippé + métadonnées."""
+    import gzip
+
+    STAGE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _stage_path(name)
+    tmp  = path.with_suffix(".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=5) as f:
+        json.dump(value, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    meta = {
+        "version":  version,
+        "run_id":   _run_state["run_id"],
+        "saved_at": datetime.utcnow().isoformat() + "Z",
+    }
+    _stage_meta_path(name).write_text(json.dumps(meta), encoding="utf-8")
+
+
+def load_stage_output(name: str):
+    import gzip
+
+    with gzip.open(_stage_path(name), "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def checkpoint_age(name: str) -> Optional[float]:
+    """Âge (s) du checkpoint de `name` depuis son enregistrement, None si inconnu."""
+    saved_at = stage_meta(name).get("saved_at")
+    if not saved_at:
+        return None
+    return (datetime.utcnow() - datetime.fromisoformat(saved_at.rstrip("Z"))).total_seconds()
+
+
+def reuse_checkpoint(name: str, version: Optional[str], max_age: Optional[float] = None):
+    """
+    Déclare la version de la source de `name` (checksum data.gouv.fr, année…)
+    et retourne sa sortie en cache si elle a été produite pour cette même
+    version — le téléchargement et le parsing sont alors évités. Sinon None.
+    `max_age` : version qui ne garantit pas un contenu inchangé (millésime,
+    effectif…) ; au-delà de cet âge le checkpoint n'est plus réutilisé.
+    """
+    if not version:
+        return None
+    _source_versions[name] = version
+    if has_stage_output(name) and stage_meta(name).get("version") == version:
+        age = checkpoint_age(name)
+        if max_age is not None and (age is None or age >= max_age):
+            log.info("%s : version inchangée (%s) mais checkpoint de plus de %d s, relecture",
+                     name, version, max_age)
+            return None
+        log.info("%s : source inchangée (%s), checkpoint réutilisé", name, version)
+        _reused.add(name)
+        return load_stage_output(name)
+    return None
+
+
+def load_run_state() -> dict:
+    try:
+        with open(RUN_STATE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_run_state(state: dict) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    RUN_STATE_FILE.write_text(json.dumps(state, indent=2), encoding="utf-8")
+
+
+def load_schedule() -> dict[str, float]:
+    try:
+        with open(SCHEDULE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def mark_refreshed(name: str, outcome: str = "ok") -> None:
+    """
+    Note l'heure du dernier rafraîchissement d'une source selon son issue :
+    "ok", "failed" (exception) ou "empty" (source joignable, aucune donnée).
+    """
+    with _schedule_lock:
+        schedule = load_schedule()
+        schedule[name if outcome == "ok" else f"{name}:{outcome}"] = time.time()
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = SCHEDULE_FILE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(schedule, indent=2), encoding="utf-8")
+        os.replace(tmp, SCHEDULE_FILE)
+
+
+def _last_miss(schedule: dict[str, float], name: str) -> float:
+    """Heure du dernier rafraîchissement sans données (échec ou résultat vide)."""
+    return max(schedule.get(f"{name}:failed", 0), schedule.get(f"{name}:empty", 0))
+
+
+def due_sources(now: Optional[float] = None) -> set[str]:
+    """
+    Sources dont la dernière mise à jour réussie est plus vieille que leur TTL
+    (une source en échec ou vide n'est retentée qu'après FAILED_SOURCE_RETRY).
+    """
+    now      = now or time.time()
+    schedule = load_schedule()
+    return {
+        name for name, ttl in SOURCE_TTL.items()
+        if now - schedule.get(name, 0) >= ttl
+        and now - _last_miss(schedule, name) >= min(ttl, FAILED_SOURCE_RETRY)
+    }
+
+
+def stale_sources() -> dict[str, dict]:
+    """
+    Sources dont le dernier rafraîchissement a échoué ou n'a rien rendu depuis
+    leur dernier succès (meta.json) : issue, date, et date du checkpoint servi
+    à la place (None si aucun, les données de la source sont alors absentes).
+    """
+    schedule = load_schedule()
+    stale: dict[str, dict] = {}
+    for name in SOURCE_FETCHERS:
+        miss = _last_miss(schedule, name)
+        if miss <= schedule.get(name, 0):
+            continue
+        failed = schedule.get(f"{name}:failed", 0) >= schedule.get(f"{name}:empty", 0)
+        if name == "fuel":
+            # Pas de checkpoint : carburants.json du dernier succès reste publié
+            served = schedule.get(name) and datetime.utcfromtimestamp(schedule[name]).isoformat() + "Z"
+        else:
+            served = stage_meta(name).get("saved_at") if has_stage_output(name) else None
+        stale[name] = {
+            "status":              "failed" if failed else "empty",
+            "since":               datetime.utcfromtimestamp(miss).isoformat() + "Z",
+            "checkpoint_saved_at": served or None,
+        }
+    return stale
+
+
+def stages_for_sources(sources: set[str]) -> set[str]:
+    """Étapes à exécuter pour rafraîchir `sources` (+ build/meta hors carburants seuls)."""
+    return set(sources) | ({"build", "meta"} if sources - {"fuel"} else set())
+
+
+def _reuse_previous(name: str, outcome: str):
+    log.warning("%s : rafraîchissement %s, checkpoint du %s réutilisé", name,
+                "en échec" if outcome == "failed" else "vide", stage_meta(name).get("saved_at", "?"))
+    return load_stage_output(name)
+
+
+def _refreshing(name: str, fn: Callable) -> Callable:
+    """
+    Enveloppe un fetcher : checkpoint de sa sortie et heure du succès.
+    Exception ("failed") ou sortie vide ("empty") → la sortie précédente est
+    réutilisée si elle existe ; l'issue est notée à part (la source reste
+    « due » pour le prochain passage) et signalée dans meta.json.
+    """
+    def run():
+        try:
+            value = fn()
+        except (Exception, SystemExit):
+            mark_refreshed(name, "failed")
+            if name == "fuel" or not has_stage_output(name):
+                raise
+            return _reuse_previous(name, "failed")
+        if name in _reused:
+            _reused.discard(name)
+            mark_refreshed(name)
+            return value
+        if not value:
+            mark_refreshed(name, "empty")
+            if name != "fuel" and has_stage_output(name):
+                return _reuse_previous(name, "empty")
+            return value
+        if name != "fuel":
+            save_stage_output(name, value, version=_source_versions.pop(name, None))
+        mark_refreshed(name)
+        return value
+    return run
+
+
+def _unavailable(name: str) -> Callable:
+    def run():
+        raise RuntimeError(f"{name} : étape ignorée et aucun checkpoint disponible")
+    return run
+
+
+def pipeline_stages(run: set[str], skip: set[str] = frozenset()) -> list[Stage]:
+    """
+    Construit le graphe d'étapes : les étapes de `run` sont exécutées ; les
+    sources dont elles ont besoin sont relues depuis leur checkpoint, ou
+    rafraîchies s'il n'en existe pas (sauf si elles sont dans `skip`).
+    """
+    needed = set(run)
+    if "build" in run:
+        needed |= set(BUILD_INPUTS)
+    if "meta" in run and "build" not in run:
+        needed.add("communes")
+
+    stages: list[Stage] = []
+    for name, fn in SOURCE_FETCHERS.items():
+        fallback = None if name == "communes" else dict
+        if name in run:
+            stages.append(Stage(name, _refreshing(name, fn), fallback=fallback))
+        elif name not in needed:
+            continue
+        elif has_stage_output(name):
+            log.info("%s : checkpoint réutilisé", name)
+            stages.append(Stage(name, lambda n=name: load_stage_output(n), fallback=fallback))
+        elif name in skip:
+            log.warning("%s : ignorée et aucun checkpoint disponible", name)
+            stages.append(Stage(name, _unavailable(name), fallback=fallback))
+        else:
+            log.info("%s : aucun checkpoint, rafraîchissement", name)
+            stages.append(Stage(name, _refreshing(name, fn), fallback=fallback))
+
+    if "build" in run:
+        stages.append(Stage("build", build_index_and_details, inputs=BUILD_INPUTS, fallback=None))
+    if "meta" in run and "build" in run:
+        # build rend le nombre de communes : la liste API Géo peut être libérée
+        stages.append(Stage("meta", write_meta, inputs=("build",), fallback=None))
+    elif "meta" in run:
+        stages.append(Stage("meta", lambda communes: write_meta(len(communes)),
+                            inputs=("communes",), fallback=None))
+    return stages
+
+
+def run_pipeline(run: set[str], workers: int, skip: set[str] = frozenset()) -> bool:
+    """
+    Exécute un passage du pipeline. Retourne False si la génération a échoué.
+    Un passage qui reconstruit (build) est repris s'il a été interrompu : les
+    sources déjà checkpointées par le run inachevé ne sont pas refaites.
+    """
+    start = time.time()
+    run   = set(run)
+    state = load_run_state() if CHECKPOINTS["enabled"] else {}
+    if "build" in run:
+        if state.get("completed") is False:
+            run_id = state["run_id"]
+            done = {
+                n for n in run & set(SOURCE_FETCHERS)
+                if has_stage_output(n) and stage_meta(n).get("run_id") == run_id
+            }
+            if done:
+                log.info("Reprise du run %s interrompu – déjà faites : %s", run_id, ", ".join(sorted(done)))
+                run -= done
+        else:
+            run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        _run_state["run_id"] = run_id
+        save_run_state({"run_id": run_id, "completed": False})
+
+    log.info("Étapes à exécuter : %s", ", ".join(n for n in STAGE_ORDER if n in run) or "aucune")
+    reset_metrics()
+    results, timeline = run_stages(pipeline_stages(run, skip), workers, keep=frozenset({"build"}))
+    log_timeline(timeline)
+    save_cassette()
+    write_run_metrics(_run_state["run_id"] if "build" in run else None, time.time() - start)
+    save_artifact_manifest()
+    wait_compression()
+    save_output_manifest()
+
+    meta_ok = timeline.get("meta", (None, None, "ok"))[2] == "ok"
+    if "build" in timeline:
+        if timeline["build"][2] != "ok":
+            log.error("Échec de la génération des données (relancer pour reprendre).")
+            return False
+        if meta_ok:
+            save_run_state({"run_id": _run_state["run_id"], "completed": True})
+    if not meta_ok:
+        # Run laissé inachevé : le prochain lancement réécrit meta.json
+        log.error("Échec de l'écriture de meta.json (relancer pour reprendre).")
+        return False
+    if timeline.get("fuel", (None, None, "ok"))[2] != "ok":
+        # Sans checkpoint de repli : carburants.json n'a pas été rafraîchi
+        log.error("Échec du rafraîchissement des carburants.")
+        return False
+    if "build" in timeline:
+        log.info("✅ Terminé en %.1f s – %d communes indexées",
+                 time.time() - start, results["build"])
+    else:
+        log.info("✅ Terminé en %.1f s", time.time() - start)
+    return True
+
+
+def run_daemon(workers: int) -> None:
+    """Boucle longue : rafraîchit chaque source à l'expiration de son TTL."""
+    log.info("Mode démon – TTL : %s",
+             ", ".join(f"{n}={t}s" for n, t in SOURCE_TTL.items()))
+    while True:
+        due = due_sources()
+        if due:
+            run_pipeline(stages_for_sources(due), workers)
+        schedule = load_schedule()
+        now      = time.time()
+        wake     = min(
+            max(schedule.get(n, 0) + ttl, _last_miss(schedule, n) + min(ttl, FAILED_SOURCE_RETRY))
+            for n, ttl in SOURCE_TTL.items()
+        )
+        delay    = max(30.0, wake - now)
+        log.info("Prochain passage dans %.0f s", delay)
+        time.sleep(delay)
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 
-def main() -> None:
+def _stage_list(text: str) -> list[str]:
+    names = [n.strip() for n in text.split(",") if n.strip()]
+    unknown = [n for n in names if n not in STAGE_ORDER]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"étape(s) inconnue(s) {', '.join(unknown)} (choix : {', '.join(STAGE_ORDER)})"
+        )
+    return names
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="VivreÀ – mise à jour des données des communes.")
+    parser.add_argument(
+        "--concurrency", type=int, default=None, metavar="N",
+        help="requêtes simultanées max par hôte (1 = séquentiel)",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=None, metavar="R",
+        help="débit max par hôte en requêtes/s (token bucket, 0 = illimité)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=7, metavar="N",
+        help="étapes exécutées simultanément (1 = séquentiel)",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="désactive le cache HTTP disque (tout est retéléchargé)",
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=None, metavar="MO",
+        help="taille max du cache HTTP disque en Mo (éviction LRU)",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--fuel-only", action="store_true",
+        help="rafraîchit uniquement data/carburants.json",
+    )
+    mode.add_argument(
+        "--scheduled", action="store_true",
+        help="rafraîchit uniquement les sources dont le TTL a expiré",
+    )
+    mode.add_argument(
+        "--daemon", action="store_true",
+        help="boucle longue : rafraîchit chaque source à l'expiration de son TTL",
+    )
+    mode.add_argument(
+        "--only", type=_stage_list, default=None, metavar="ÉTAPES",
+        help="exécute uniquement ces étapes (ex. crime ou build), entrées relues des checkpoints",
+    )
+    mode.add_argument(
+        "--from", dest="from_stage", choices=STAGE_ORDER, default=None, metavar="ÉTAPE",
+        help="exécute cette étape et les suivantes (%s)" % ", ".join(STAGE_ORDER),
+    )
+    parser.add_argument(
+        "--skip", type=_stage_list, default=[], metavar="ÉTAPES",
+        help="n'exécute pas ces étapes (checkpoint réutilisé s'il existe)",
+    )
+    parser.add_argument(
+        "--compress", action="store_true",
+        help="écrit aussi des fichiers .gz/.br pré-compressés à côté de chaque JSON généré",
+    )
+    parser.add_argument(
+        "--fuel-compact", action="store_true",
+        help="écrit aussi data/carburants.compact.json (colonnes, dictionnaires, millièmes)",
+    )
+    parser.add_argument(
+        "--hashed", action="store_true",
+        help="écrit aussi des copies à nom haché (immuables) et data/manifest.json",
+    )
+    parser.add_argument(
+        "--keep-generations", type=int, default=None, metavar="N",
+        help="générations de fichiers hachés conservées (défaut 3)",
+    )
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument(
+        "--record", type=Path, default=None, metavar="DIR",
+        help="enregistre toutes les réponses HTTP dans la cassette DIR (sans cache ni checkpoints)",
+    )
+    cassette.add_argument(
+        "--replay", type=Path, default=None, metavar="DIR",
+        help="rejoue la cassette DIR via un serveur local, sans réseau (sans cache ni checkpoints)",
+    )
+    parser.add_argument(
+        "--profile", choices=("cprofile", "trace"), default=None,
+        help="profil par étape dans .cache/profile/ : cProfile (.prof) ou trace Chrome (trace.json)",
+    )
+    parser.add_argument(
+        "--fresh", action="store_true",
+        help="ignore les checkpoints (ni reprise, ni réutilisation par version)",
+    )
+    parser.add_argument(
+        "--ttl", action="append", default=[], metavar="SOURCE=DURÉE",
+        help="surcharge un TTL, ex. fuel=5m, dvf=7d (répétable)",
+    )
+    parser.add_argument(
+        "--budget", action="append", default=[], metavar="ÉTAPE=DURÉE",
+        help="surcharge le budget de temps d'une étape, ex. air=2m, dvf=0 (sans limite, répétable)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
     log.info("╔══════════════════════════════════════════════╗")
     log.info("║   VivreÀ – Mise à jour des données v2.3     ║")
     log.info("╚══════════════════════════════════════════════╝")
-    start = time.time()
 
+    configure_host_limits(args.concurrency, args.rate)
+    configure_http_cache(not args.no_cache, args.cache_size)
+    CHECKPOINTS["enabled"]  = not args.fresh
+    COMPRESSION["enabled"]  = args.compress
+    HASHED["enabled"]       = args.hashed
+    FUEL_COMPACT["enabled"] = args.fuel_compact
+    if args.keep_generations is not None:
+        HASHED["keep"] = max(1, args.keep_generations)
+    PROFILE["mode"] = args.profile
+    if args.record or args.replay:
+        configure_http_cache(False)
+        CHECKPOINTS["enabled"] = False
+        if args.record:
+            start_recording(args.record)
+        else:
+            try:
+                start_replay(args.replay)
+            except (OSError, ValueError) as e:
+                log.error("--replay : %s", e)
+                sys.exit(2)
+    if args.profile == "cprofile" and args.workers > 1:
+        log.info("--profile cprofile : étapes exécutées une à une")
+        args.workers = 1
+    for item in args.ttl:
+        name, _, duration = item.partition("=")
+        if name not in SOURCE_TTL:
+            log.error("--ttl : source inconnue %r (%s)", name, ", ".join(SOURCE_TTL))
+            sys.exit(2)
+        SOURCE_TTL[name] = parse_duration(duration)
+    for item in args.budget:
+        name, _, duration = item.partition("=")
+        if name not in STAGE_BUDGETS:
+            log.error("--budget : étape inconnue %r (%s)", name, ", ".join(STAGE_BUDGETS))
+            sys.exit(2)
+        STAGE_BUDGETS[name] = parse_duration(duration)
     DATA_DIR.mkdir(exist_ok=True)
     DETAILS_DIR.mkdir(parents=True, exist_ok=True)
 
-    communes   = fetch_all_communes()
-    dvf_stats  = fetch_dvf_stats()
-    fibre_data = fetch_arcep_fibre()
-    fetch_fuel_prices()
-    crime_data = fetch_crime_data()
-    air_data   = fetch_air_quality()
-    socio_data = fetch_filosofi()
-    build_index_and_details(
-        communes, dvf_stats, fibre_data,
-        crime_data, air_data, socio_data,
-    )
-    write_meta(len(communes))
+    if args.daemon:
+        run_daemon(args.workers)
+        return
+
+    if args.fuel_only:
+        run = {"fuel"}
+    elif args.scheduled:
+        run = stages_for_sources(due_sources())
+    elif args.only:
+        run = set(args.only)
+    elif args.from_stage:
+        run = set(STAGE_ORDER[STAGE_ORDER.index(args.from_stage):])
+    else:
+        run = set(STAGE_ORDER)
+    skip = set(args.skip)
 
-    log.info("✅ Terminé en %.1f s – %d communes indexées", time.time() - start, len(communes))
+    if not run_pipeline(run - skip, args.workers, skip):
+        sys.exit(1)
 
 
 if __name__ == "__main__":